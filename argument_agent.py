@@ -1,150 +1,390 @@
 """Communicating agent."""
 
 import logging
-from random import choice
+from collections import Counter, OrderedDict, defaultdict
+from time import perf_counter
 
-from typing import Dict, List
+from typing import Dict, FrozenSet, List, Optional, Set
 
 from communication.agent.CommunicatingAgent import CommunicatingAgent
 from communication.agent.preferences_agent import PreferencesAgent
 from communication.arguments.Argument import Argument
+from communication.arguments.Discussion import Discussion
+from communication.message.Message import Message
 from communication.message.MessagePerformative import MessagePerformative
 from communication.preferences.Item import Item
 from communication.preferences.Preferences import Preferences
 from communication.preferences.Value import Value
 
+PERFORMATIVE_INDEX = {
+    performative: index for index, performative in enumerate(MessagePerformative)
+}
+
 
 class ArgumentAgent(CommunicatingAgent, PreferencesAgent):
-    """ArgumentAgent."""
+    """ArgumentAgent.
+
+    The discussions are keyed by (peer, opening item): the messages of a discussion
+    carry its opening item as conversation id, so that crossing proposals between two
+    agents open two separate discussions.
+
+    The generated arguments are memoized in a bounded LRU cache keyed by (item, incoming
+    argument fingerprint, already discussed items), cleared when the preferences change
+    (a new version, or a new Preferences object set with set_preferences).
+
+    A discussion that goes beyond the limits of the model (max_discussion_rounds,
+    max_discussion_steps, max_discussion_messages) is aborted: it is dropped, its
+    messages are released, the peer is told with a CANCEL message (it drops its side of
+    the discussion) and it is counted in nbr_aborted. Each received argument, question
+    (ASK_WHY) and re-proposal counts as a round; the rounds and messages are checked
+    when one of them arrives, and the messages of an aborted discussion are ignored.
+    With max_discussion_steps, the
+    agent stays awake while it has open discussions and expires them at each step, so
+    a discussion waiting for a reply also times out.
+
+    The counters of the agent are mirrored in the event counters of the model
+    (model.events), which the data collector reads.
+    """
+
+    argument_cache_size: int = 1024
+
+    # Performative -> name of its handler method, in processing order
+    message_handlers: Dict[MessagePerformative, str] = {
+        MessagePerformative.CANCEL: "handle_cancel",
+        MessagePerformative.ARGUE: "handle_argue",
+        MessagePerformative.COMMIT: "handle_commit",
+        MessagePerformative.PROPOSE: "handle_propose",
+        MessagePerformative.ACCEPT: "handle_accept",
+        MessagePerformative.ASK_WHY: "handle_ask_why",
+    }
 
     def __init__(self, unique_id, model, name):
-        CommunicatingAgent.__init__(self, unique_id, model, name)
+        CommunicatingAgent.__init__(
+            self, unique_id, model, name, mailbox=model.create_mailbox(name)
+        )
         self.preference = Preferences()
+        self.rng = model.spawn_rng()
         self.logger = logging.getLogger(self.name)
-        self.current_discussions: Dict[str, List[Argument]] = {}
+        self.current_discussions: Dict[tuple, Discussion] = {}
+        self.contacted_peers: Set = set()  # the peers we opened a discussion with
 
         self.nbr_won: int = 0
         self.nbr_agreements: int = 0
+        self.nbr_aborted: int = 0
         self.deals_won: List[int] = []  # list of ids of item
-        self.performative_uses: Dict[str, int] = {
-            performative.name: 0 for performative in MessagePerformative
-        }
+        self.handler_calls: Dict[str, int] = Counter()
+        self.handler_time: Dict[str, float] = defaultdict(float)
+
+        self.argument_cache: "OrderedDict[tuple, Optional[Argument]]" = OrderedDict()
+        # The preferences (object and version) the cached arguments were generated with
+        self.argument_cache_preferences: Optional[Preferences] = None
+        self.argument_cache_version: int = -1
+        self.argument_cache_hits: int = 0
+        self.argument_cache_misses: int = 0
 
     def step(self):
-        """Step for the client agent."""
+        """Step for the client agent.
+
+        The agent opens its new discussions, then drains its mailbox once: the unread
+        messages of each performative are passed to their handler, following the order
+        of message_handlers. Last, it expires its discussions over the step limit.
+        """
+        self.open_discussions()
+        for performative, handler_name in self.message_handlers.items():
+            handler = getattr(self, handler_name)
+            for message in self.pop_unread_messages(performative):
+                start = perf_counter()
+                handler(message)
+                self.handler_calls[handler_name] += 1
+                self.handler_time[handler_name] += perf_counter() - start
+        self.expire_discussions()
+
+    def record_event(self, name: str, index=(), amount: int = 1) -> None:
+        """Increment the row of the agent in an event counter of the model."""
+        self.model.events.increment_agent(name, self.unique_id, index, amount)
+
+    def send_message(self, message: Message) -> None:
+        """Send message and count it in the event counters."""
+        super().send_message(message)
+        nbr_receivers = len(message.get_recipients())
+        self.record_event("nbr_sent_messages", amount=nbr_receivers)
+        self.record_event(
+            "performative_uses",
+            PERFORMATIVE_INDEX[message.get_performative()],
+            nbr_receivers,
+        )
+
+    def can_open_discussions(self) -> bool:
+        """Return whether the agent starts discussions."""
         # TODO: REMOVE LATER
-        if self.name == "Agent1" or len(self.model.schedule.agents) != 2:
-            item_to_send = self.preference.most_preferred(self.model.items)
-            for agent in self.get_all_agents_except_me():
-                if agent.unique_id not in self.current_discussions:
-                    self.current_discussions[agent.unique_id] = []
-                    self.propose(item_to_send, agent)
-                    self.performative_uses[MessagePerformative.PROPOSE.name] += 1
-
-        # We argue while we still can
-        while self.has_unread_message_with_performative(MessagePerformative.ARGUE):
-            argue_message = self.get_last_unread_message_with_performative(
-                MessagePerformative.ARGUE
+        return self.name == "Agent1" or self.model.schedule.get_agent_count() != 2
+
+    def has_pending_work(self) -> bool:
+        """Return whether the agent has unread messages or discussions to open."""
+        if super().has_pending_work():
+            return True
+        if self.model.max_discussion_steps is not None and self.current_discussions:
+            return True
+        if not self.can_open_discussions():
+            return False
+        if self.model.renegotiate:
+            return len(self.get_discussed_peers()) < len(
+                self.model.get_neighbours(self.unique_id)
             )
-            argument: Argument = argue_message.get_content()
-            self.current_discussions[argue_message.get_exp()].append(argument)
+        return len(self.contacted_peers) < len(self.model.get_neighbours(self.unique_id))
+
+    def get_discussed_peers(self) -> Set:
+        """Return the peers with which the agent has open discussions."""
+        return {peer for peer, _ in self.current_discussions}
+
+    def get_discussion(self, message: Message) -> Optional[Discussion]:
+        """Return the open discussion a message belongs to (None if there is none)."""
+        return self.current_discussions.get(
+            (message.get_exp(), message.get_conversation_id())
+        )
+
+    def release_discussion(self, discussion: Discussion) -> None:
+        """Let the mailbox drop the messages of the peer once no discussion is open."""
+        if discussion.peer not in self.get_discussed_peers():
+            self.release_messages_from_exp(discussion.peer)
+
+    def open_discussions(self):
+        """Propose our favourite item to the neighbours we are not discussing with.
+
+        Without renegotiation (model.renegotiate), each neighbour is only contacted once.
+        """
+        if self.can_open_discussions():
+            discussed_peers = self.get_discussed_peers()
+            peers = [
+                agent_id
+                for agent_id in self.model.get_neighbours(self.unique_id)
+                if agent_id not in discussed_peers
+                and (self.model.renegotiate or agent_id not in self.contacted_peers)
+            ]
+            if peers:
+                item = self.preference.most_preferred(self.model.items)
+                for agent_id in peers:
+                    discussion = Discussion(agent_id, item, self.model.schedule.steps)
+                    discussion.add_messages()
+                    self.current_discussions[discussion.key] = discussion
+                self.contacted_peers.update(peers)
+                self.propose_to_all(item, peers, conversation_id=item)
+
+    def abort_if_over_limits(self, discussion: Discussion) -> bool:
+        """Abort the discussion if it went beyond the limits of the model."""
+        if not discussion.exceeds_limits(
+            self.model.schedule.steps,
+            self.model.max_discussion_rounds,
+            self.model.max_discussion_steps,
+            self.model.max_discussion_messages,
+        ):
+            return False
+        self.logger.info("Discussion aborted: %s", discussion)
+        del self.current_discussions[discussion.key]
+        discussion.abort()
+        self.release_discussion(discussion)
+        self.cancel(discussion.peer, discussion.item, conversation_id=discussion.item)
+        self.nbr_aborted += 1
+        self.record_event("nbr_aborted")
+        self.model.nbr_aborted_discussions += 1
+        self.model.events.increment("nbr_aborted_discussions")
+        return True
+
+    def expire_discussions(self) -> None:
+        """Abort the open discussions that went beyond the step limit of the model."""
+        if self.model.max_discussion_steps is None:
+            return
+        for discussion in list(self.current_discussions.values()):
+            self.abort_if_over_limits(discussion)
+
+    def handle_cancel(self, cancel_message: Message):
+        """Drop the discussion the peer aborted."""
+        discussion = self.get_discussion(cancel_message)
+        if discussion is not None:
+            del self.current_discussions[discussion.key]
+            discussion.abort()
+            self.release_discussion(discussion)
 
-            new_argument = self.generate_argument(
+    def handle_argue(self, argue_message: Message):
+        """We argue while we still can."""
+        argument: Argument = argue_message.get_content()
+        discussion = self.get_discussion(argue_message)
+        if discussion is None:
+            # The discussion was aborted
+            return
+        discussion.add_argument(argument)
+        discussion.add_messages()
+        if self.abort_if_over_limits(discussion):
+            return
+        discussion.add_messages()
+
+        new_argument = self.generate_argument(
+            item=argument.item, argument=argument, discussion=discussion
+        )
+        if new_argument is None:
+            self.accept(
+                proposer_agent_id=argue_message.get_exp(),
                 item=argument.item,
-                argument=argument,
-                past_arguments=self.current_discussions[argue_message.get_exp(
-                )],
+                conversation_id=discussion.item,
             )
-            if new_argument is None:
-                self.accept(
-                    proposer_agent_id=argue_message.get_exp(), item=argument.item
-                )
-                self.performative_uses[MessagePerformative.ACCEPT.name] += 1
-            else:
-                self.argue(to_agent=argue_message.get_exp(),
-                           argument=new_argument)
-                self.performative_uses[MessagePerformative.ARGUE.name] += 1
-
-        # If we receive a commit message, we check if we need to reply
-        while self.has_unread_message_with_performative(MessagePerformative.COMMIT):
-            commit_message = self.get_last_unread_message_with_performative(
-                MessagePerformative.COMMIT
+        else:
+            self.argue(
+                to_agent=argue_message.get_exp(),
+                argument=new_argument,
+                conversation_id=discussion.item,
             )
-            if commit_message.get_exp() in self.current_discussions:
-                del self.current_discussions[commit_message.get_exp()]
 
-            item, reply_to_commit = commit_message.get_content()
-            if reply_to_commit:
-                self.logger.info(
-                    "Deal done with item %s  (agent %s -> %s)",
-                    item,
-                    commit_message.get_exp(),
-                    self.unique_id,
-                )
-                self.model.done_deals[item.get_name()] += 1
-                self.nbr_won += 1
-            else:
-                self.nbr_agreements += 1
-                self.commit(
-                    to_agent=commit_message.get_exp(), item=item, reply_to_commit=True
-                )
-                self.performative_uses[MessagePerformative.COMMIT.name] += 1
+    def handle_commit(self, commit_message: Message):
+        """If we receive a commit message, we check if we need to reply."""
+        item, reply_to_commit = commit_message.get_content()
+        discussion = self.get_discussion(commit_message)
+        if discussion is not None:
+            del self.current_discussions[discussion.key]
+            discussion.close(outcome=item)
+            self.release_discussion(discussion)
 
-        # For each propose message
-        while self.has_unread_message_with_performative(MessagePerformative.PROPOSE):
-            propose_message = self.get_last_unread_message_with_performative(
-                MessagePerformative.PROPOSE
+        if reply_to_commit:
+            self.logger.info(
+                "Deal done with item %s  (agent %s -> %s)",
+                item,
+                commit_message.get_exp(),
+                self.unique_id,
             )
-            self.current_discussions[propose_message.get_exp()] = []
-            item = propose_message.get_content()
-
-            # Check if it is the best item
-            if self.preference.most_preferred(self.model.items) == item:
-                self.accept(
-                    proposer_agent_id=propose_message.get_exp(), item=item)
-                self.performative_uses[MessagePerformative.ACCEPT.name] += 1
-            else:
-                self.ask_why(to_agent=propose_message.get_exp(), item=item)
-                self.performative_uses[MessagePerformative.ASK_WHY.name] += 1
-
-        # For each accept message
-        while self.has_unread_message_with_performative(MessagePerformative.ACCEPT):
-            accept_message = self.get_last_unread_message_with_performative(
-                MessagePerformative.ACCEPT
+            self.model.done_deals[item.get_name()] += 1
+            self.model.events.increment(
+                "done_deals", self.model.item_catalog.get_id(item)
             )
+            self.nbr_won += 1
+            self.record_event("nbr_won")
+        else:
+            self.nbr_agreements += 1
+            self.record_event("nbr_agreements")
             self.commit(
-                to_agent=accept_message.get_exp(), item=accept_message.get_content()
+                to_agent=commit_message.get_exp(),
+                item=item,
+                reply_to_commit=True,
+                conversation_id=commit_message.get_conversation_id(),
+            )
+
+    def handle_propose(self, propose_message: Message):
+        """Accept the proposed item if it is our favourite one, ask why otherwise.
+
+        A proposal in an open discussion (the proposer could not argue) is a new round
+        of that discussion.
+        """
+        item = propose_message.get_content()
+        conversation_id = propose_message.get_conversation_id()
+        discussion = self.get_discussion(propose_message)
+        if discussion is None:
+            discussion = Discussion(
+                propose_message.get_exp(), conversation_id, self.model.schedule.steps
+            )
+            self.current_discussions[discussion.key] = discussion
+        else:
+            discussion.add_round()
+        discussion.add_messages()
+        if self.abort_if_over_limits(discussion):
+            return
+        discussion.add_messages()
+
+        # Check if it is the best item
+        if self.preference.most_preferred(self.model.items) == item:
+            self.accept(
+                proposer_agent_id=propose_message.get_exp(),
+                item=item,
+                conversation_id=conversation_id,
+            )
+        else:
+            self.ask_why(
+                to_agent=propose_message.get_exp(),
+                item=item,
+                conversation_id=conversation_id,
             )
-            self.performative_uses[MessagePerformative.COMMIT.name] += 1
-            self.nbr_agreements += 1
-            self.deals_won.append(self.model.items.index(
-                accept_message.get_content()))
 
-        # For each ask why message
-        while self.has_unread_message_with_performative(MessagePerformative.ASK_WHY):
-            ask_message = self.get_last_unread_message_with_performative(
-                MessagePerformative.ASK_WHY
+    def handle_accept(self, accept_message: Message):
+        """Commit to an accepted item."""
+        self.commit(
+            to_agent=accept_message.get_exp(),
+            item=accept_message.get_content(),
+            conversation_id=accept_message.get_conversation_id(),
+        )
+        self.nbr_agreements += 1
+        self.record_event("nbr_agreements")
+        item_id = self.model.item_catalog.get_id(accept_message.get_content())
+        self.deals_won.append(item_id)
+        self.record_event("deals_won_per_item", item_id)
+
+    def handle_ask_why(self, ask_message: Message):
+        """Argue in favour of the item, or propose another one if we cannot."""
+        item = ask_message.get_content()
+        discussion = self.get_discussion(ask_message)
+        if discussion is None:
+            # The discussion was aborted
+            return
+        discussion.add_round()
+        discussion.add_messages()
+        if self.abort_if_over_limits(discussion):
+            return
+        discussion.add_messages()
+        argument = self.generate_argument(item)
+        if argument is not None:
+            self.argue(
+                ask_message.get_exp(),
+                argument,
+                conversation_id=ask_message.get_conversation_id(),
+            )
+        else:
+            other_items = [x for x in self.model.items if x != item]
+            new_item = other_items[self.rng.integers(len(other_items))]
+            self.propose(
+                item=new_item,
+                receiver=ask_message.get_exp(),
+                conversation_id=ask_message.get_conversation_id(),
             )
-            item = ask_message.get_content()
-            argument = self.generate_argument(item)
-            if argument is not None:
-                self.argue(ask_message.get_exp(), argument)
-                self.performative_uses[MessagePerformative.ARGUE.name] += 1
-            else:
-                new_item = choice([x for x in self.model.items if x != item])
-                self.propose(item=new_item, receiver=ask_message.get_exp())
-                self.performative_uses[MessagePerformative.PROPOSE.name] += 1
 
     def generate_argument(
         self,
         item: Item,
         argument: Argument = None,
-        past_arguments: List[Argument] = None,
+        discussion: Discussion = None,
     ) -> Argument:
-        """Check if we can attack argument."""
-        if past_arguments is None:
-            past_arguments = []
-        already_talked_about = set([x.get_item() for x in past_arguments])
+        """Check if we can attack argument (memoized)."""
+        already_talked_about = (
+            frozenset() if discussion is None else discussion.get_discussed_items()
+        )
+
+        if (
+            self.argument_cache_preferences is not self.preference
+            or self.argument_cache_version != self.preference.get_version()
+        ):
+            self.argument_cache.clear()
+            self.argument_cache_preferences = self.preference
+            self.argument_cache_version = self.preference.get_version()
+        key = (
+            item,
+            None if argument is None else argument.fingerprint(),
+            already_talked_about,
+        )
+        if key in self.argument_cache:
+            self.argument_cache_hits += 1
+            self.argument_cache.move_to_end(key)
+            return self.argument_cache[key]
+
+        self.argument_cache_misses += 1
+        new_argument = self.__generate_argument(item, argument, already_talked_about)
+        self.argument_cache[key] = new_argument
+        if len(self.argument_cache) > self.argument_cache_size:
+            self.argument_cache.popitem(last=False)
+        return new_argument
+
+    def __generate_argument(
+        self,
+        item: Item,
+        argument: Optional[Argument],
+        already_talked_about: FrozenSet[Item],
+    ) -> Optional[Argument]:
+        """Generate an argument (attacking argument if given)."""
+        excluded_items = already_talked_about | {item}
 
         # if no previous argument, then just create one (first time)
         if argument is None:
@@ -168,34 +408,21 @@ class ArgumentAgent(CommunicatingAgent, PreferencesAgent):
             couple_value = argument.couple_values_list[0]
 
             # If Y has a better alternative O_j, j != i, on c_i
-            other_items = [
-                x
-                for x in self.model.items
-                if x != item
-                and self.preference.get_value(x, couple_value.criterion_name)
-                > couple_value.value
-            ]
-            other_items = list(
-                filter(lambda x: x not in already_talked_about, other_items)
+            other_item = self.preference.get_best_alternative_on_criterion(
+                self.model.items,
+                couple_value.criterion_name,
+                couple_value.value,
+                excluded_items,
             )
-            if len(other_items) > 0:
+            if other_item is not None:
                 self.logger.info(
                     "We have a criterion value, If Y has a better alternative O_j, j != i, on c_i"
                 )
-                other_items = list(
-                    sorted(
-                        other_items,
-                        key=lambda x: self.preference.get_value(
-                            item=x, criterion_name=couple_value.criterion_name
-                        ),
-                        reverse=True,
-                    )
-                )
-                argument = Argument(True, other_items[0])
+                argument = Argument(True, other_item)
                 argument.add_premiss_couple_values(
                     couple_value.criterion_name,
                     self.preference.get_value(
-                        other_items[0], couple_value.criterion_name
+                        other_item, couple_value.criterion_name
                     ),
                 )
 
@@ -248,31 +475,21 @@ class ArgumentAgent(CommunicatingAgent, PreferencesAgent):
             couple_value = argument.couple_values_list[0]
             comparison = argument.comparison_list[0]
             # If Y has a better alternative O_j, j != i, on c_i
-            items = self.model.items[:]
-            items = list(filter(lambda x: x != item, items))
-            items = list(
-                filter(
-                    lambda x: self.preference.get_value(
-                        x, couple_value.criterion_name)
-                    > couple_value.value,
-                    items,
-                )
-            )
-            items = list(
-                sorted(items, key=lambda x: x.get_score(
-                    self.preference), reverse=True)
+            other_item = self.preference.get_best_alternative(
+                self.model.items,
+                couple_value.criterion_name,
+                couple_value.value,
+                excluded_items,
             )
-            items = list(
-                filter(lambda x: x not in already_talked_about, items))
-            if len(items) > 0:
+            if other_item is not None:
                 self.logger.info(
                     "We have a comparison, If Y has a better alternative O_j, j != i, on c_i"
                 )
-                argument = Argument(True, items[0])
+                argument = Argument(True, other_item)
                 argument.add_premiss_couple_values(
                     couple_value.criterion_name,
                     self.preference.get_value(
-                        items[0], couple_value.criterion_name),
+                        other_item, couple_value.criterion_name),
                 )
                 return argument
 
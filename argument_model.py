@@ -1,70 +1,220 @@
 """Main file."""
+import os
+import random
+import tempfile
+from typing import Optional
 
-
+import numpy as np
 from mesa import Model
-from mesa.datacollection import DataCollector
-from mesa.time import RandomActivation
 
 from argument_agent import ArgumentAgent
+from checkpoint import get_checkpoint_path, save_checkpoint
+from communication.datacollection.CollectionCadence import CollectionCadence
+from communication.datacollection.ColumnarDataCollector import ColumnarDataCollector
+from communication.datacollection.EventCounters import EventCounters
+from communication.mailbox.Mailbox import Mailbox
+from communication.mailbox.RetentionPolicy import RetentionPolicy
+from communication.message.MessagePerformative import MessagePerformative
 from communication.message.MessageService import MessageService
 from communication.preferences.Item import Item
+from communication.preferences.ItemCatalog import ItemCatalog
+from communication.preferences.PreferencesGenerator import PreferencesGenerator
+from communication.scheduler.EventDrivenActivation import EventDrivenActivation
+from topology import build_topology
 
-
-def count_item_deals(item_id: str):
-    """Count the number of students in one activity."""
-
-    def count(model):
-        """Count function."""
-        return model.done_deals[item_id]
-
-    return count
+# Parameters with which a run settles (see ArgumentModel.is_quiescent): each neighbour
+# is contacted once and the discussions stuck in argument cycles are aborted. They are
+# opt-in: the default experiment renegotiates and does not bound the discussions
+SETTLING_PARAMS = {"renegotiate": False, "max_discussion_rounds": 20}
 
 
 class ArgumentModel(Model):
-    """ArgumentModel."""
-
-    def __init__(self, nb_items: int = 5, nb_agents: int = 2) -> None:
-        self.schedule = RandomActivation(self)
-        MessageService.__instance = None
-        self.__messages_service = MessageService(self.schedule)
-
-        # Define Items
-        self.items = [
+    """ArgumentModel.
+
+    Every random draw of a run derives from its seed: the seed sequence is spawned into
+    independent streams for the preferences (rng), the topology, the scheduler
+    (random) and each agent (agent.rng, see spawn_rng). Two models built with the
+    same seed give the same run, whatever else runs in the process.
+
+    The model stops (running is False) as soon as it is quiescent, and records the step
+    in convergence_step. With renegotiate (the default), the agents open new discussions
+    after each deal, so the run never stops; without it, some discussions argue in
+    cycles, so the run only stops if they are bounded (see SETTLING_PARAMS).
+
+    The whole model can be saved and restored with checkpoint.py, automatically every
+    checkpoint_every steps if set. A restored model spilling messages to disk writes
+    them to temporary files, deleted by close().
+    """
+
+    def __init__(
+        self,
+        nb_items: int = 5,
+        nb_agents: int = 2,
+        seed: Optional[int] = None,
+        retention_policy: RetentionPolicy = RetentionPolicy.KEEP_ALL,
+        max_read_messages: Optional[int] = None,
+        spill_folder: Optional[str] = None,
+        instant_delivery: bool = True,
+        latency=0,
+        topology: str = "complete",
+        topology_degree: int = 4,
+        rewiring_probability: float = 0.1,
+        max_discussion_rounds: Optional[int] = None,
+        max_discussion_steps: Optional[int] = None,
+        max_discussion_messages: Optional[int] = None,
+        collection_cadence: CollectionCadence = CollectionCadence.EVERY_K_STEPS,
+        collection_every: int = 1,
+        renegotiate: bool = True,
+        checkpoint_every: Optional[int] = None,
+        checkpoint_folder: Optional[str] = None,
+    ) -> None:
+        self.seed_sequence = np.random.SeedSequence(seed)
+        # The drawn entropy if no seed was given, to be able to replay the run
+        self.seed = self.seed_sequence.entropy
+        (
+            preferences_seed,
+            topology_seed,
+            scheduler_seed,
+            self.agent_seeds,
+        ) = self.seed_sequence.spawn(4)
+        self.rng = np.random.default_rng(preferences_seed)
+        self.random = random.Random(int(scheduler_seed.generate_state(1)[0]))
+        if retention_policy == RetentionPolicy.SPILL_TO_DISK and spill_folder is None:
+            raise ValueError("SPILL_TO_DISK needs spill_folder")
+        self.retention_policy = retention_policy
+        self.max_read_messages = max_read_messages
+        self.spill_folder = spill_folder
+        # Each model spills to its own subfolder, so models can share spill_folder
+        self.spill_directory: Optional[str] = None
+        if retention_policy == RetentionPolicy.SPILL_TO_DISK:
+            os.makedirs(spill_folder, exist_ok=True)
+            self.spill_directory = tempfile.mkdtemp(prefix="model-", dir=spill_folder)
+        # Limits of a discussion (None: unbounded), beyond which it is aborted
+        self.max_discussion_rounds = max_discussion_rounds
+        self.max_discussion_steps = max_discussion_steps
+        self.max_discussion_messages = max_discussion_messages
+        self.nbr_aborted_discussions = 0
+        # Whether the agents reopen discussions after a deal (the run never settles)
+        self.renegotiate = renegotiate
+        self.convergence_step: Optional[int] = None
+        # Automatic checkpoints (see checkpoint.py), every checkpoint_every steps
+        if checkpoint_every is not None and checkpoint_folder is None:
+            raise ValueError("checkpoint_every needs checkpoint_folder")
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_folder = checkpoint_folder
+        self.schedule = EventDrivenActivation(self)
+        self.message_service = MessageService(self.schedule, instant_delivery)
+        self.message_service.set_latency(latency)
+
+        # Define Items (the id of an item is its index in self.items)
+        self.item_catalog = ItemCatalog()
+        for item in [
             Item("E", "Elec"),
             Item("D", "Diesel"),
             *[Item(str(i), "Car " + str(i))
               for i in range(1, nb_items - 2 + 1)],
-        ]
+        ]:
+            self.item_catalog.register(item)
+        self.items = self.item_catalog.get_items()
         self.done_deals = {x.get_name(): 0 for x in self.items}
 
-        # Define agents
+        # Counters incremented by the agents, read by the data collector
+        self.events = EventCounters(range(nb_agents))
+        self.events.add_counter("done_deals", (len(self.items),))
+        self.events.add_counter("nbr_aborted_discussions")
+        for name in ["nbr_won", "nbr_sent_messages", "nbr_agreements", "nbr_aborted"]:
+            self.events.add_agent_counter(name)
+        self.events.add_agent_counter("deals_won_per_item", (len(self.items),))
+        self.events.add_agent_counter("performative_uses", (len(MessagePerformative),))
+
+        # Define agents (the preferences are drawn for the whole population at once)
+        preferences = PreferencesGenerator(
+            self.items, self.rng, self.item_catalog.get_index()
+        ).generate(nb_agents)
         for agent_id in range(nb_agents):
             agent = ArgumentAgent(agent_id, self, f"Agent{agent_id+1}")
-            agent.generate_preferences()
+            agent.set_preferences(preferences[agent_id])
             self.schedule.add(agent)
 
+        # Define who discusses with whom
+        self.neighbours = build_topology(
+            topology,
+            nb_agents,
+            int(topology_seed.generate_state(1)[0]),
+            topology_degree,
+            rewiring_probability,
+        )
+
         self.running = True
 
-        self.datacollector = DataCollector(
-            model_reporters={
-                **{
-                    f"item_{i}": x.get_name()  # count_item_deals(x.get_name())
-                    for i, x in enumerate(self.items)
-                },
+        self.datacollector = ColumnarDataCollector(
+            events=self.events,
+            model_events={
+                "nbr_aborted_discussions": None,
+                "done_deals": [f"item_{i}" for i in range(len(self.items))],
             },
-            agent_reporters={
-                "nbr_won": "nbr_won",
-                "nbr_sent_messages": "nbr_sent_messages",
-                "nbr_agreements": "nbr_agreements",
-                "deals_won": "deals_won",
-                "performative_uses": "performative_uses",
+            agent_events={
+                "nbr_won": None,
+                "nbr_sent_messages": None,
+                "nbr_agreements": None,
+                "nbr_aborted": None,
+                "deals_won_per_item": None,
+                "performative_uses": [
+                    f"performative_uses_{performative.name}"
+                    for performative in MessagePerformative
+                ],
             },
+            cadence=collection_cadence,
+            every=collection_every,
         )
 
+    def spawn_rng(self) -> np.random.Generator:
+        """Return a new independent random generator (one per agent, in creation order)."""
+        return np.random.default_rng(self.agent_seeds.spawn(1)[0])
+
+    def get_neighbours(self, agent_id):
+        """Return the ids of the agents an agent opens discussions with."""
+        return self.neighbours.get(agent_id, ())
+
+    def create_mailbox(self, agent_name: str) -> Mailbox:
+        """Create the mailbox of an agent, following the retention settings."""
+        spill_path = None
+        if self.retention_policy == RetentionPolicy.SPILL_TO_DISK:
+            spill_path = os.path.join(self.spill_directory, f"{agent_name}.log")
+        return Mailbox(self.retention_policy, self.max_read_messages, spill_path)
+
+    def get_nbr_open_discussions(self) -> int:
+        """Return the number of discussions still open (for all the agents)."""
+        return sum(len(agent.current_discussions) for agent in self.schedule.agents)
+
+    def is_quiescent(self) -> bool:
+        """Return whether nothing can happen anymore.
+
+        No agent is awake (no unread message, no discussion to open) and no message is
+        in flight; the discussions still open, if any, wait for replies that never come.
+        """
+        return (
+            self.schedule.get_nbr_awake_agents() == 0
+            and self.message_service.get_nbr_pending_messages() == 0
+        )
+
+    def close(self) -> None:
+        """Close the files of the mailboxes (the spilled messages) once the run is over."""
+        for agent in self.schedule.agents:
+            agent.close_mailbox()
+
     def step(self):
-        self.datacollector.collect(self)
-        self.__messages_service.dispatch_messages()
+        self.datacollector.collect_step(self)
+        self.message_service.dispatch_messages()
         self.schedule.step()
+        if self.running and self.is_quiescent():
+            self.running = False
+            self.convergence_step = self.schedule.steps
+            self.datacollector.collect_final(self)
+        if self.checkpoint_every and self.schedule.steps % self.checkpoint_every == 0:
+            save_checkpoint(
+                self, get_checkpoint_path(self.checkpoint_folder, self.schedule.steps)
+            )
 
 
 if __name__ == "__main__":
@@ -72,6 +222,6 @@ if __name__ == "__main__":
 
     logging.basicConfig(level=logging.INFO)
     argument_model = ArgumentModel()
-    for _ in range(25):
+    while argument_model.running and argument_model.schedule.steps < 25:
         print("\n")
         argument_model.step()
@@ -0,0 +1,50 @@
+"""Checkpoints: save a whole model mid-run and restore it later (or several times)."""
+
+import gzip
+import os
+import pickle
+from typing import Optional
+
+CHECKPOINT_SUFFIX = ".pkl.gz"
+
+
+def save_checkpoint(model, path: str, compresslevel: int = 6) -> str:
+    """Save the full state of a model (gzip-compressed pickle) and return the path.
+
+    Everything reachable from the model is saved: the schedule (agents, their order and
+    which ones are awake), the preferences, the mailboxes, the discussions, the queue
+    of the message service, the random generators and the collected data. The file is
+    replaced atomically. Latency functions, if any, must be picklable (no lambda).
+    """
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with gzip.open(path + ".tmp", "wb", compresslevel=compresslevel) as checkpoint_file:
+        pickle.dump(model, checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def load_checkpoint(path: str, checkpoint_folder: Optional[str] = None):
+    """Restore a model saved by save_checkpoint.
+
+    Each call gives an independent model, so a checkpoint can be forked into several
+    variants (change their parameters, then step them). The spilled messages of a
+    restored model are in temporary files owned by the model: call its close() method
+    once done with it to delete them.
+
+    The automatic checkpoints of the restored model go to checkpoint_folder (pass the
+    original folder to resume a run in place); without it, they are turned off, so
+    that a fork never overwrites the checkpoints of the original run.
+    """
+    with gzip.open(path, "rb") as checkpoint_file:
+        model = pickle.load(checkpoint_file)
+    model.checkpoint_folder = checkpoint_folder
+    if checkpoint_folder is None:
+        model.checkpoint_every = None
+    return model
+
+
+def get_checkpoint_path(folder: str, step: int) -> str:
+    """Return the path of the automatic checkpoint of a step."""
+    return os.path.join(folder, f"step-{step:06d}{CHECKPOINT_SUFFIX}")
@@ -1,12 +1,13 @@
 #!/usr/bin/env python3
 
+from typing import Optional
+
 from mesa import Agent
 
 from communication.arguments.Argument import Argument
 from communication.mailbox.Mailbox import Mailbox
 from communication.message.Message import Message
 from communication.message.MessagePerformative import MessagePerformative
-from communication.message.MessageService import MessageService
 from communication.preferences.Item import Item
 
 
@@ -17,24 +18,41 @@ class CommunicatingAgent(Agent):
     Not intended to be used on its own, but to inherit its methods to multiple
     other agents.
 
+    The messages sent with propose, accept, ask_why, commit, cancel and argue can carry a
+    conversation id, to tell apart several conversations with the same agent.
+
     attr:
         name: The name of the agent (str)
         mailbox: The mailbox of the agent (Mailbox)
-        message_service: The message service used to send and receive message (MessageService)
+        message_service: The message service of the model, used to send and receive message
+            (MessageService)
+        nbr_sent_messages: The number of sent messages, one per receiver (int)
+        performative_uses: The number of sent messages by performative name (dict)
     """
 
-    def __init__(self, unique_id, model, name):
-        """Create a new communicating agent."""
+    def __init__(self, unique_id, model, name, mailbox: Optional[Mailbox] = None):
+        """Create a new communicating agent (with an unbounded mailbox by default)."""
         super().__init__(unique_id, model)
         self.__name = name
-        self.__mailbox = Mailbox()
-        self.__messages_service = MessageService.get_instance()
+        self.__mailbox = Mailbox() if mailbox is None else mailbox
         self.nbr_sent_messages = 0
+        self.performative_uses = {
+            performative.name: 0 for performative in MessagePerformative
+        }
 
     def step(self):
         """The step methods of the agent called by the scheduler at each time tick."""
         super().step()
 
+    def has_pending_work(self) -> bool:
+        """Return whether the agent has something to do at its next step (unread messages)."""
+        return self.__mailbox.has_unread_messages()
+
+    @property
+    def message_service(self):
+        """Return the message service of the model."""
+        return self.model.message_service
+
     @property
     def name(self):
         """Return the name of the communicating agent."""
@@ -44,26 +62,67 @@ class CommunicatingAgent(Agent):
         """Receive a message (called by the MessageService object) and store it in the mailbox."""
         self.__mailbox.receive_messages(message)
 
+    def receive_messages(self, messages):
+        """Receive a batch of messages (called by the MessageService object)."""
+        self.__mailbox.receive_message_batch(messages)
+
     def send_message(self, message: Message) -> None:
         """Send message through the MessageService object."""
-        self.__messages_service.send_message(message)
-        self.nbr_sent_messages += 1
+        self.model.message_service.send_message(message)
+        nbr_receivers = len(message.get_recipients())
+        self.nbr_sent_messages += nbr_receivers
+        self.performative_uses[message.get_performative().name] += nbr_receivers
+
+    def broadcast(
+        self,
+        performative: MessagePerformative,
+        content,
+        recipients=None,
+        conversation_id=None,
+    ):
+        """Send one message to several agents.
+
+        recipients can be None (every other agent), a group name or a list of agent ids.
+        Return the ids of the receivers.
+        """
+        receivers = self.model.message_service.resolve_recipients(
+            recipients, sender=self.unique_id
+        )
+        if receivers:
+            self.send_message(
+                Message(
+                    from_agent=self.unique_id,
+                    to_agent=receivers,
+                    message_performative=performative,
+                    content=content,
+                    conversation_id=conversation_id,
+                )
+            )
+        return receivers
 
     def get_new_messages(self):
         """Return all the unread messages."""
         return self.__mailbox.get_new_messages()
 
-    def get_messages(self):
+    def get_messages(self, include_spilled: bool = False):
         """Return all the received messages."""
-        return self.__mailbox.get_messages()
+        return self.__mailbox.get_messages(include_spilled)
 
     def get_messages_from_performative(self, performative: MessagePerformative):
         """Return a list of messages which have the same performative."""
         return self.__mailbox.get_messages_from_performative(performative)
 
-    def get_messages_from_exp(self, exp):
+    def get_messages_from_exp(self, exp, include_spilled: bool = False):
         """Return a list of messages which have the same sender."""
-        return self.__mailbox.get_messages_from_exp(exp)
+        return self.__mailbox.get_messages_from_exp(exp, include_spilled)
+
+    def close_mailbox(self):
+        """Close the files of the mailbox (its spilled messages)."""
+        self.__mailbox.close()
+
+    def release_messages_from_exp(self, exp):
+        """Let the mailbox drop the messages of a finished discussion."""
+        self.__mailbox.release_messages_from_exp(exp)
 
     def has_unread_message_with_performative(
         self, performative: MessagePerformative, agent_id: str = None
@@ -72,6 +131,12 @@ class CommunicatingAgent(Agent):
             performative, agent_id
         )
 
+    def pop_unread_messages(
+        self, performative: MessagePerformative, agent_id: str = None
+    ):
+        """Mark as read and return all the unread messages with this performative."""
+        return self.__mailbox.pop_unread_messages(performative, agent_id)
+
     def get_last_unread_message_with_performative(
         self, performative: MessagePerformative, agent_id: str = None
     ):
@@ -79,18 +144,25 @@ class CommunicatingAgent(Agent):
             performative, agent_id
         )
 
-    def propose(self, item: Item, receiver) -> None:
+    def propose(self, item: Item, receiver, conversation_id=None) -> None:
         """Propose item."""
         self.send_message(
             Message(
                 from_agent=self.unique_id,
-                to_agent=receiver.unique_id,
+                to_agent=receiver,
                 message_performative=MessagePerformative.PROPOSE,
                 content=item,
+                conversation_id=conversation_id,
             )
         )
 
-    def accept(self, proposer_agent_id: str, item: Item):
+    def propose_to_all(self, item: Item, recipients=None, conversation_id=None):
+        """Propose item to several agents at once (every other agent by default)."""
+        return self.broadcast(
+            MessagePerformative.PROPOSE, item, recipients, conversation_id
+        )
+
+    def accept(self, proposer_agent_id: str, item: Item, conversation_id=None):
         """Accept an agent proposition"""
         self.send_message(
             Message(
@@ -98,10 +170,11 @@ class CommunicatingAgent(Agent):
                 to_agent=proposer_agent_id,
                 message_performative=MessagePerformative.ACCEPT,
                 content=item,
+                conversation_id=conversation_id,
             )
         )
 
-    def ask_why(self, to_agent: str, item: Item):
+    def ask_why(self, to_agent: str, item: Item, conversation_id=None):
         """Init."""
         self.send_message(
             Message(
@@ -109,10 +182,17 @@ class CommunicatingAgent(Agent):
                 to_agent=to_agent,
                 message_performative=MessagePerformative.ASK_WHY,
                 content=item,
+                conversation_id=conversation_id,
             )
         )
 
-    def commit(self, to_agent: str, item: Item, reply_to_commit: bool = False):
+    def commit(
+        self,
+        to_agent: str,
+        item: Item,
+        reply_to_commit: bool = False,
+        conversation_id=None,
+    ):
         """Init."""
         self.send_message(
             Message(
@@ -120,10 +200,23 @@ class CommunicatingAgent(Agent):
                 to_agent=to_agent,
                 message_performative=MessagePerformative.COMMIT,
                 content=(item, reply_to_commit),
+                conversation_id=conversation_id,
+            )
+        )
+
+    def cancel(self, to_agent: str, item: Item, conversation_id=None):
+        """Tell an agent that the discussion about item is aborted."""
+        self.send_message(
+            Message(
+                from_agent=self.unique_id,
+                to_agent=to_agent,
+                message_performative=MessagePerformative.CANCEL,
+                content=item,
+                conversation_id=conversation_id,
             )
         )
 
-    def argue(self, to_agent: str, argument: Argument):
+    def argue(self, to_agent: str, argument: Argument, conversation_id=None):
         """Argue."""
         self.send_message(
             Message(
@@ -131,5 +224,6 @@ class CommunicatingAgent(Agent):
                 to_agent=to_agent,
                 message_performative=MessagePerformative.ARGUE,
                 content=argument,
+                conversation_id=conversation_id,
             )
         )
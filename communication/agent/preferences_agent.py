@@ -1,7 +1,6 @@
 """Preferences."""
 
 import logging
-from random import choice, shuffle
 from typing import List, Optional
 
 from mesa import Model
@@ -20,16 +19,26 @@ from communication.preferences.Value import Value
 
 
 class PreferencesAgent:
+    """PreferencesAgent class.
+    Mixin giving preferences to an agent.
+
+    The random preferences are drawn with the numpy generator of the agent (rng).
+    """
+
     def get_preference(self):
         return self.preference
 
+    def set_preferences(self, preference: Preferences):
+        """Set the preferences of the agent (e.g. drawn for the whole population)."""
+        self.preference = preference
+        logging.info("Agent name: %s\n%s", self.name, preference)
+
     def generate_preferences(self):
         """Generate the preferences (order and threshold) of the agent."""
         # Add the list in order of preference
         self.__generate_random_preferences()
 
-        print(f"Agent name: {self.name}")
-        print(self.get_preference())
+        logging.info("Agent name: %s\n%s", self.name, self.get_preference())
         return
         if self.name == "Agent1":
 
@@ -112,13 +121,17 @@ class PreferencesAgent:
     def __generate_random_preferences(self):
         """Generate the preferences (order and threshold) of the agent."""
         list_criterions = list(CriterionName)
-        shuffle(list_criterions)
-        self.preference.set_criterion_name_list(list_criterions)
+        self.preference.set_criterion_name_list(
+            [list_criterions[i] for i in self.rng.permutation(len(list_criterions))]
+        )
 
         # Set the thresholds for each criterion
+        values = list(Value)
         for item in self.model.items:
             for criterion_name in CriterionName:
                 # generate random value
                 self.preference.add_criterion_value(
-                    CriterionValue(item, criterion_name, choice(list(Value)))
+                    CriterionValue(
+                        item, criterion_name, values[self.rng.integers(len(values))]
+                    )
                 )
@@ -16,6 +16,9 @@ class Argument:
     """Argument class.
     This class implements an argument used in the negotiation.
 
+    Two arguments are equal when they have the same fingerprint (decision, item,
+    comparisons and couple values); an argument should not be modified once hashed.
+
     attr:
         decision:
         item:
@@ -36,14 +39,29 @@ class Argument:
     def get_item(self):
         return self.item
 
-    def __eq__(self, __o: object) -> bool:
+    def fingerprint(self) -> tuple:
+        """Return a canonical hashable description of the argument."""
         return (
-            self.decision == __o.decision
-            and self.item == __o.item
-            and str(self.comparison_list) == str(__o.comparision_list)
-            and str(self.couple_values_list) == str(__o.couple_values_list)
+            self.decision,
+            self.item,
+            tuple(
+                (comparison.best_criterion_name, comparison.worst_criterion_name)
+                for comparison in self.comparison_list
+            ),
+            tuple(
+                (couple_value.criterion_name, couple_value.value)
+                for couple_value in self.couple_values_list
+            ),
         )
 
+    def __eq__(self, __o: object) -> bool:
+        if not isinstance(__o, Argument):
+            return NotImplemented
+        return self.fingerprint() == __o.fingerprint()
+
+    def __hash__(self) -> int:
+        return hash(self.fingerprint())
+
     def add_premiss_comparison(
         self, best_criterion_name: CriterionName, worst_criterion_name: CriterionName
     ):
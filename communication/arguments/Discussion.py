@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+from typing import FrozenSet, Optional, Set
+
+from communication.arguments.Argument import Argument
+from communication.preferences.Item import Item
+
+
+class Discussion:
+    """Discussion class.
+    This class implements the state of a discussion with another agent, updated
+    incrementally with each received argument. A discussion is identified by its key,
+    (peer, item): two agents can hold several discussions at once, opened with
+    different items (their messages carry the item as conversation id).
+
+    The rounds, messages and steps of a discussion can be bounded (see
+    exceeds_limits), in which case the agent aborts it.
+
+    attr:
+        peer: the id of the other agent
+        item: the item the discussion was opened with
+        discussed_items: the items of the received arguments
+        nbr_rounds: the number of rounds (received arguments, questions and re-proposals)
+        nbr_messages: the number of messages sent and received in the discussion
+        opened_at: the step at which the discussion was opened
+        last_argument: the last received argument
+        outcome: the item of the deal once the discussion is closed (None while open)
+        aborted: whether the discussion was closed without a deal because of a limit
+    """
+
+    __slots__ = (
+        "peer",
+        "item",
+        "discussed_items",
+        "nbr_rounds",
+        "nbr_messages",
+        "opened_at",
+        "last_argument",
+        "outcome",
+        "closed",
+        "aborted",
+        "__frozen_items",
+    )
+
+    def __init__(self, peer, item: Optional[Item] = None, opened_at: int = 0):
+        """Creates a new (open) Discussion."""
+        self.peer = peer
+        self.item = item
+        self.discussed_items: Set[Item] = set()
+        self.nbr_rounds = 0
+        self.nbr_messages = 0
+        self.opened_at = opened_at
+        self.last_argument: Optional[Argument] = None
+        self.outcome: Optional[Item] = None
+        self.closed = False
+        self.aborted = False
+        self.__frozen_items: FrozenSet[Item] = frozenset()
+
+    @property
+    def key(self) -> tuple:
+        """Returns the key of the discussion, (peer, item)."""
+        return (self.peer, self.item)
+
+    def add_round(self) -> None:
+        """Record a round of the discussion."""
+        self.nbr_rounds += 1
+
+    def add_argument(self, argument: Argument) -> None:
+        """Record a received argument."""
+        self.add_round()
+        self.last_argument = argument
+        if argument.get_item() not in self.discussed_items:
+            self.discussed_items.add(argument.get_item())
+            self.__frozen_items = frozenset(self.discussed_items)
+
+    def add_messages(self, nbr_messages: int = 1) -> None:
+        """Record sent or received messages."""
+        self.nbr_messages += nbr_messages
+
+    def exceeds_limits(
+        self,
+        step: int,
+        max_rounds: Optional[int] = None,
+        max_steps: Optional[int] = None,
+        max_messages: Optional[int] = None,
+    ) -> bool:
+        """Returns whether the discussion went beyond one of its limits (None: unbounded)."""
+        return (
+            (max_rounds is not None and self.nbr_rounds > max_rounds)
+            or (max_steps is not None and step - self.opened_at > max_steps)
+            or (max_messages is not None and self.nbr_messages > max_messages)
+        )
+
+    def get_discussed_items(self) -> FrozenSet[Item]:
+        """Returns the discussed items (as a frozenset, rebuilt only when it grows)."""
+        return self.__frozen_items
+
+    def close(self, outcome: Optional[Item] = None) -> None:
+        """Close the discussion and release its arguments."""
+        self.closed = True
+        self.outcome = outcome
+        self.discussed_items = set()
+        self.last_argument = None
+        self.__frozen_items = frozenset()
+
+    def abort(self) -> None:
+        """Close the discussion without a deal."""
+        self.close()
+        self.aborted = True
+
+    def __str__(self) -> str:
+        return (
+            f"Discussion with {self.peer} on {self.item}: {self.nbr_rounds} rounds, "
+            f"{self.nbr_messages} messages, {len(self.discussed_items)} items, "
+            f"outcome {'aborted' if self.aborted else self.outcome}"
+        )
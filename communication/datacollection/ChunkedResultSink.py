@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+import json
+import os
+from importlib.util import find_spec
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+MANIFEST_NAME = "manifest.json"
+FORMATS = ("parquet", "npy", "csv")
+TABLES = ("model", "agents")
+
+
+def default_format() -> str:
+    """Return parquet if pyarrow is installed, npy otherwise."""
+    return "parquet" if find_spec("pyarrow") is not None else "npy"
+
+
+class ChunkedResultSink:
+    """ChunkedResultSink class.
+    This class implements a sink streaming the rows of a ColumnarDataCollector to disk,
+    in one shard per table (model, agents) every flush_every steps.
+
+    The shards are Parquet files (if pyarrow is installed), NumPy .npy record arrays
+    or CSV files. A manifest (manifest.json) lists the shards, the index columns and
+    the last flushed step; it is rewritten atomically after each flush, so the results
+    can be read (lazily, shard by shard, with iter_chunks) while the run goes on.
+
+    A sink opened on a folder that has a manifest continues it (resume), otherwise the
+    folder gets a new manifest.
+
+    attr:
+        folder: the folder of the shards and of the manifest
+        flush_every: the number of steps between two flushes
+        file_format: the format of the shards (parquet, npy or csv)
+        manifest: the content of the manifest (dict)
+    """
+
+    def __init__(
+        self,
+        folder: str,
+        flush_every: int = 10,
+        file_format: Optional[str] = None,
+        metadata: Optional[Dict] = None,
+    ):
+        """Create a new ChunkedResultSink (or continue the one of the folder)."""
+        self.folder = folder
+        self.flush_every = flush_every
+        os.makedirs(folder, exist_ok=True)
+        if self.has_manifest(folder):
+            self.manifest = self.read_manifest(folder)
+            self.file_format = self.manifest["format"]
+            return
+
+        self.file_format = file_format or default_format()
+        if self.file_format not in FORMATS:
+            raise ValueError(f"Unknown format {self.file_format}")
+        self.manifest = {
+            "format": self.file_format,
+            "metadata": metadata or {},
+            "last_step": None,
+            "complete": False,
+            "tables": {table: {"index": [], "shards": []} for table in TABLES},
+        }
+        self.__write_manifest()
+
+    def get_last_step(self) -> Optional[int]:
+        """Return the last model step flushed to disk (None if nothing was flushed)."""
+        return self.manifest["last_step"]
+
+    def is_complete(self) -> bool:
+        """Return whether the run was closed."""
+        return self.manifest["complete"]
+
+    def step(self, model) -> None:
+        """Flush the collector of the model if flush_every steps went by."""
+        if model.schedule.steps - (self.get_last_step() or 0) >= self.flush_every:
+            self.flush(model)
+
+    def flush(self, model) -> None:
+        """Write the rows collected so far in new shards."""
+        collector = model.datacollector
+        if collector.nbr_steps > 0:
+            for table, dataframe in zip(TABLES, collector.drain()):
+                self.__write_shard(table, dataframe)
+        self.manifest["last_step"] = model.schedule.steps
+        self.__write_manifest()
+
+    def close(self, model, metadata: Optional[Dict] = None) -> None:
+        """Flush the end of the run and mark it as complete (with more metadata)."""
+        model.datacollector.collect_final(model)
+        self.manifest["metadata"].update(metadata or {})
+        self.manifest["complete"] = True
+        self.flush(model)
+
+    def __write_shard(self, table: str, dataframe: pd.DataFrame) -> None:
+        """Write one shard of a table."""
+        shards = self.manifest["tables"][table]["shards"]
+        file_name = f"{table}-{len(shards):05d}.{self.file_format}"
+        path = os.path.join(self.folder, file_name)
+        if self.file_format == "parquet":
+            dataframe.to_parquet(path)
+        elif self.file_format == "npy":
+            np.save(path, dataframe.to_records(index=True), allow_pickle=False)
+        else:
+            dataframe.to_csv(path)
+        self.manifest["tables"][table]["index"] = list(dataframe.index.names)
+        shards.append(file_name)
+
+    def __write_manifest(self) -> None:
+        """Replace the manifest (atomically)."""
+        path = os.path.join(self.folder, MANIFEST_NAME)
+        with open(path + ".tmp", "w") as manifest_file:
+            json.dump(self.manifest, manifest_file, indent=2)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def has_manifest(folder: str) -> bool:
+        """Return whether a results folder has a manifest (a run to continue)."""
+        return os.path.exists(os.path.join(folder, MANIFEST_NAME))
+
+    @staticmethod
+    def read_manifest(folder: str) -> Dict:
+        """Return the manifest of a results folder."""
+        with open(os.path.join(folder, MANIFEST_NAME)) as manifest_file:
+            return json.load(manifest_file)
+
+    @staticmethod
+    def iter_chunks(folder: str, table: str = "agents") -> Iterator[pd.DataFrame]:
+        """Yield the shards of a table one by one, as DataFrames."""
+        manifest = ChunkedResultSink.read_manifest(folder)
+        index: List[str] = manifest["tables"][table]["index"]
+        for file_name in manifest["tables"][table]["shards"]:
+            path = os.path.join(folder, file_name)
+            if manifest["format"] == "parquet":
+                yield pd.read_parquet(path)
+            elif manifest["format"] == "npy":
+                yield pd.DataFrame.from_records(np.load(path)).set_index(index)
+            else:
+                yield pd.read_csv(path).set_index(index)
+
+    @staticmethod
+    def read_table(folder: str, table: str = "agents") -> pd.DataFrame:
+        """Return a whole table (all its shards)."""
+        chunks = list(ChunkedResultSink.iter_chunks(folder, table))
+        if not chunks:
+            return pd.DataFrame()
+        return pd.concat(chunks)
@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+
+from enum import Enum
+
+
+class CollectionCadence(Enum):
+    """CollectionCadence enum class.
+    Enumeration containing the possible cadences of a data collector.
+    """
+
+    EVERY_K_STEPS = 0
+    ON_CHANGE = 1
+    FINAL_ONLY = 2
+
+    def __str__(self):
+        """Returns the name of the enum item."""
+        return "{0}".format(self.name)
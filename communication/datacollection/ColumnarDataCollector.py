@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+from itertools import chain
+from operator import attrgetter, itemgetter
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from communication.datacollection.CollectionCadence import CollectionCadence
+from communication.datacollection.EventCounters import EventCounters
+
+# The columns of a counter: a list of keys (column "<attribute>_<key>") or a
+# dict column name -> key
+CounterColumns = Union[Sequence, Mapping[str, object]]
+
+
+class ColumnarDataCollector:
+    """ColumnarDataCollector class.
+    This class implements a data collector storing each step in preallocated NumPy
+    arrays instead of Python rows, with the same getters as mesa's DataCollector.
+
+    The collected values are copied at each step (no aliasing of mutable attributes):
+        model_metrics: scalar attributes of the model (steps array)
+        model_counters: dict attributes of the model, one column per key (steps x keys)
+        agent_metrics: scalar attributes of the agents (steps x agents x metrics)
+        agent_counters: dict attributes of the agents, one column per key
+            (steps x agents x keys)
+        model_events, agent_events: counters of an EventCounters store, copied as whole
+            arrays (the column names are given, or derived from the counter name)
+
+    The arrays grow by chunk_size steps when full, and along the agent axis when new
+    agents appear. The DataFrames are only built on request.
+
+    collect_step decides whether a step is collected, according to the cadence:
+        EVERY_K_STEPS: the steps multiple of every
+        ON_CHANGE: the steps where the event counters changed since the last collection
+        FINAL_ONLY: none, only collect_final collects
+    collect_final collects the current step at the end of a run (if not yet collected).
+    drain returns the collected rows as DataFrames and empties the collector, so that
+    they can be streamed to disk (see ChunkedResultSink) while keeping the arrays.
+
+    attr:
+        nbr_steps: the number of collected steps
+        steps: the model step of each collected row
+        agent_ids: the ids of the collected agents, in column order
+        present: the steps x agents array telling whether an agent was in the schedule
+    """
+
+    def __init__(
+        self,
+        model_metrics: Optional[List[str]] = None,
+        model_counters: Optional[Dict[str, CounterColumns]] = None,
+        agent_metrics: Optional[List[str]] = None,
+        agent_counters: Optional[Dict[str, CounterColumns]] = None,
+        chunk_size: int = 64,
+        dtype=np.int64,
+        events: Optional[EventCounters] = None,
+        model_events: Optional[Dict[str, Optional[Sequence[str]]]] = None,
+        agent_events: Optional[Dict[str, Optional[Sequence[str]]]] = None,
+        cadence: CollectionCadence = CollectionCadence.EVERY_K_STEPS,
+        every: int = 1,
+    ):
+        """Create a new, empty ColumnarDataCollector."""
+        needs_events = model_events or agent_events
+        if events is None and (needs_events or cadence == CollectionCadence.ON_CHANGE):
+            raise ValueError("The event reporters and ON_CHANGE need events")
+        self.chunk_size = chunk_size
+        self.dtype = dtype
+        self.cadence = cadence
+        self.every = every
+        self.events = events
+        self.model_metrics = list(model_metrics or [])
+        self.model_counters = {
+            name: self.__get_columns(name, columns)
+            for name, columns in (model_counters or {}).items()
+        }
+        self.agent_metrics = list(agent_metrics or [])
+        self.agent_counters = {
+            name: self.__get_columns(name, columns)
+            for name, columns in (agent_counters or {}).items()
+        }
+        self.model_events = {
+            name: self.__get_event_columns(name, columns, events.get(name).shape)
+            for name, columns in (model_events or {}).items()
+        }
+        self.agent_events = {
+            name: self.__get_event_columns(name, columns, events.get(name).shape[1:])
+            for name, columns in (agent_events or {}).items()
+        }
+
+        self.nbr_steps = 0
+        self.steps = np.zeros(0, dtype=np.int64)
+        self.agent_ids: List = []
+        self.__agent_index: Dict[object, int] = {}
+        self.__last_version: Optional[int] = None
+        self.__last_collected_step: Optional[int] = None
+        self.__model_values = np.zeros((0, len(self.model_metrics)), dtype=dtype)
+        self.__model_counter_values = {
+            name: np.zeros((0, len(columns)), dtype=dtype)
+            for name, columns in chain(
+                self.model_counters.items(), self.model_events.items()
+            )
+        }
+        self.__agent_values = np.zeros((0, 0, len(self.agent_metrics)), dtype=dtype)
+        self.__agent_counter_values = {
+            name: np.zeros((0, 0, len(columns)), dtype=dtype)
+            for name, columns in chain(
+                self.agent_counters.items(), self.agent_events.items()
+            )
+        }
+        self.present = np.zeros((0, 0), dtype=bool)
+        if events is not None:
+            # The rows of the agent events are the first agent columns
+            self.__add_agents(events.agent_ids)
+
+    @staticmethod
+    def __get_columns(name: str, columns: CounterColumns) -> Dict[str, object]:
+        """Return the dict column name -> key of a counter."""
+        if isinstance(columns, Mapping):
+            return dict(columns)
+        return {f"{name}_{key}": key for key in columns}
+
+    @staticmethod
+    def __get_event_columns(
+        name: str, columns: Optional[Sequence[str]], shape
+    ) -> List[str]:
+        """Return the column names of an event counter (one per cell)."""
+        nbr_columns = int(np.prod(shape, dtype=np.int64))
+        if columns is None:
+            columns = [f"{name}_{i}" for i in range(nbr_columns)]
+            if shape == ():
+                columns = [name]
+        if len(columns) != nbr_columns:
+            raise ValueError(f"Counter {name} has {nbr_columns} cells")
+        return list(columns)
+
+    def __add_agents(self, agent_ids) -> None:
+        """Give a column to the agents that do not have one yet."""
+        for agent_id in agent_ids:
+            if agent_id not in self.__agent_index:
+                self.__agent_index[agent_id] = len(self.agent_ids)
+                self.agent_ids.append(agent_id)
+
+    def __grow(self, nbr_agents: int) -> None:
+        """Make room for one more step and nbr_agents agents."""
+        nbr_rows = len(self.present)
+        if self.nbr_steps < nbr_rows and nbr_agents <= self.present.shape[1]:
+            return
+        if self.nbr_steps >= nbr_rows:
+            nbr_rows += self.chunk_size
+        nbr_agents = max(nbr_agents, self.present.shape[1])
+
+        def resize(array: np.ndarray, agent_axis: bool = True) -> np.ndarray:
+            shape = (nbr_rows, *array.shape[1:])
+            if agent_axis:
+                shape = (nbr_rows, nbr_agents, *array.shape[2:])
+            new_array = np.zeros(shape, dtype=array.dtype)
+            new_array[tuple(slice(0, size) for size in array.shape)] = array
+            return new_array
+
+        self.steps = resize(self.steps, agent_axis=False)
+        self.__model_values = resize(self.__model_values, agent_axis=False)
+        for name, values in self.__model_counter_values.items():
+            self.__model_counter_values[name] = resize(values, agent_axis=False)
+        self.__agent_values = resize(self.__agent_values)
+        for name, values in self.__agent_counter_values.items():
+            self.__agent_counter_values[name] = resize(values)
+        self.present = resize(self.present)
+
+    def collect_step(self, model) -> None:
+        """Collect the current step if the cadence asks for it."""
+        if self.cadence == CollectionCadence.EVERY_K_STEPS:
+            if model.schedule.steps % self.every == 0:
+                self.collect(model)
+        elif self.cadence == CollectionCadence.ON_CHANGE:
+            if self.events.version != self.__last_version:
+                self.collect(model)
+
+    def collect_final(self, model) -> None:
+        """Collect the current step at the end of a run, if not collected yet."""
+        if self.__last_collected_step != model.schedule.steps:
+            self.collect(model)
+
+    def collect(self, model) -> None:
+        """Collect the values of the model and of its agents for one step."""
+        agents = model.schedule.agents
+        self.__add_agents(agent.unique_id for agent in agents)
+        self.__grow(len(self.agent_ids))
+        step = self.nbr_steps
+        self.steps[step] = model.schedule.steps
+
+        self.__model_values[step] = [
+            getattr(model, name) for name in self.model_metrics
+        ]
+        for name, columns in self.model_counters.items():
+            counter = getattr(model, name)
+            self.__model_counter_values[name][step] = [
+                counter[key] for key in columns.values()
+            ]
+
+        columns = [self.__agent_index[agent.unique_id] for agent in agents]
+        self.present[step, columns] = True
+        if agents and self.agent_metrics:
+            self.__agent_values[step, columns] = self.__read_rows(
+                agents,
+                lambda agent, get=attrgetter(*self.agent_metrics): get(agent),
+                len(self.agent_metrics),
+            )
+        for name, keys in self.agent_counters.items():
+            if agents and keys:
+                self.__agent_counter_values[name][step, columns] = self.__read_rows(
+                    agents,
+                    lambda agent, get=itemgetter(*keys.values()): get(
+                        getattr(agent, name)
+                    ),
+                    len(keys),
+                )
+
+        if self.events is not None:
+            for name in self.model_events:
+                self.__model_counter_values[name][step] = self.events.get(name).ravel()
+            nbr_event_agents = len(self.events.agent_ids)
+            for name in self.agent_events:
+                values = self.events.get(name).reshape(nbr_event_agents, -1)
+                self.__agent_counter_values[name][step, :nbr_event_agents] = values
+            self.__last_version = self.events.version
+        self.__last_collected_step = model.schedule.steps
+        self.nbr_steps += 1
+
+    def __read_rows(self, agents, read_row, nbr_columns: int) -> np.ndarray:
+        """Return the agents x columns array of the rows read from each agent."""
+        if nbr_columns == 1:
+            rows = map(read_row, agents)
+        else:
+            rows = chain.from_iterable(map(read_row, agents))
+        return np.fromiter(rows, self.dtype, len(agents) * nbr_columns).reshape(
+            len(agents), nbr_columns
+        )
+
+    def get_agent_values(self, name: str) -> np.ndarray:
+        """Return the steps x agents (x keys for a counter) array of an agent attribute."""
+        if name in self.__agent_counter_values:
+            return self.__agent_counter_values[name][: self.nbr_steps]
+        return self.__agent_values[: self.nbr_steps, :, self.agent_metrics.index(name)]
+
+    def get_model_values(self, name: str) -> np.ndarray:
+        """Return the steps (x keys for a counter) array of a model attribute."""
+        if name in self.__model_counter_values:
+            return self.__model_counter_values[name][: self.nbr_steps]
+        return self.__model_values[: self.nbr_steps, self.model_metrics.index(name)]
+
+    def __get_model_columns(self) -> Dict[str, np.ndarray]:
+        """Return the collected model values by column, as arrays."""
+        model_columns = {
+            name: self.get_model_values(name) for name in self.model_metrics
+        }
+        for name, columns in chain(
+            self.model_counters.items(), self.model_events.items()
+        ):
+            values = self.get_model_values(name)
+            for column_idx, column in enumerate(columns):
+                model_columns[column] = values[:, column_idx]
+        return model_columns
+
+    @property
+    def model_vars(self) -> Dict[str, list]:
+        """Return the collected model values by column (like mesa's DataCollector).
+
+        The values are lists of Python numbers, which mesa's visualization modules can
+        JSON-encode.
+        """
+        return {
+            column: values.tolist()
+            for column, values in self.__get_model_columns().items()
+        }
+
+    def get_model_vars_dataframe(self) -> pd.DataFrame:
+        """Return a DataFrame with one row per collected step."""
+        return pd.DataFrame(
+            self.__get_model_columns(),
+            index=pd.Index(self.steps[: self.nbr_steps], name="Step"),
+        )
+
+    def get_agent_vars_dataframe(self) -> pd.DataFrame:
+        """Return a DataFrame indexed by (Step, AgentID), like mesa's DataCollector."""
+        rows, agent_columns = np.nonzero(self.present[: self.nbr_steps])
+        data = {
+            name: self.get_agent_values(name)[rows, agent_columns]
+            for name in self.agent_metrics
+        }
+        for name, columns in chain(
+            self.agent_counters.items(), self.agent_events.items()
+        ):
+            values = self.get_agent_values(name)[rows, agent_columns]
+            for column_idx, column in enumerate(columns):
+                data[column] = values[:, column_idx]
+        index = pd.MultiIndex.from_arrays(
+            [self.steps[rows], np.asarray(self.agent_ids)[agent_columns]],
+            names=["Step", "AgentID"],
+        )
+        return pd.DataFrame(data, index=index)
+
+    def drain(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Return the (model, agent) DataFrames of the collected rows and forget them."""
+        dataframes = self.get_model_vars_dataframe(), self.get_agent_vars_dataframe()
+        self.clear()
+        return dataframes
+
+    def clear(self) -> None:
+        """Forget the collected rows (the arrays are kept for the next ones)."""
+        self.present[: self.nbr_steps] = False
+        self.nbr_steps = 0
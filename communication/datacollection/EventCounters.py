@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+
+class EventCounters:
+    """EventCounters class.
+    This class implements a store of event counters (NumPy arrays) that the agents
+    increment as things happen, so that the data collector copies whole arrays instead
+    of reading each agent.
+
+    A counter is either a model counter, of any shape, or an agent counter, whose first
+    axis is indexed by the agents (in the order of agent_ids).
+
+    attr:
+        agent_ids: the ids of the agents of the agent counters, in row order
+        counters: the arrays by counter name
+        agent_counters: the names of the agent counters
+        version: the number of increments so far, to detect changes
+    """
+
+    def __init__(self, agent_ids: Sequence = ()):
+        """Creates a new, empty EventCounters."""
+        self.agent_ids: List = list(agent_ids)
+        self.__agent_index: Dict[object, int] = {
+            agent_id: row for row, agent_id in enumerate(self.agent_ids)
+        }
+        self.counters: Dict[str, np.ndarray] = {}
+        self.agent_counters: List[str] = []
+        self.version = 0
+
+    def add_counter(self, name: str, shape: Tuple[int, ...] = ()) -> np.ndarray:
+        """Add a model counter (a scalar by default)."""
+        if name in self.counters:
+            raise ValueError(f"Counter {name} already exists")
+        self.counters[name] = np.zeros(shape, dtype=np.int64)
+        return self.counters[name]
+
+    def add_agent_counter(self, name: str, shape: Tuple[int, ...] = ()) -> np.ndarray:
+        """Add a counter with one row per agent (of the given shape)."""
+        counter = self.add_counter(name, (len(self.agent_ids), *shape))
+        self.agent_counters.append(name)
+        return counter
+
+    def increment(self, name: str, index=(), amount: int = 1) -> None:
+        """Increment one cell of a model counter."""
+        self.counters[name][index] += amount
+        self.version += 1
+
+    def increment_agent(self, name: str, agent_id, index=(), amount: int = 1) -> None:
+        """Increment one cell of the row of an agent in an agent counter."""
+        if not isinstance(index, tuple):
+            index = (index,)
+        self.counters[name][(self.__agent_index[agent_id], *index)] += amount
+        self.version += 1
+
+    def get(self, name: str) -> np.ndarray:
+        """Returns the array of a counter."""
+        return self.counters[name]
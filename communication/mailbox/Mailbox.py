@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 
-from typing import List, Optional
-
-import mesa
+from collections import OrderedDict, defaultdict, deque
+from typing import Deque, Dict, List, Optional
 
+from communication.mailbox.MessageLog import MessageLog
+from communication.mailbox.RetentionPolicy import RetentionPolicy
 from communication.message.Message import Message
 from communication.message.MessagePerformative import MessagePerformative
 
@@ -12,79 +13,226 @@ class Mailbox:
     """Mailbox class.
     Class implementing the mailbox object which manages messages in communicating agents.
 
+    The unread messages are indexed by performative, by sender and by (performative,
+    sender), so that checking or popping the next unread message is O(1). Each index is
+    an OrderedDict (arrival number -> message) in arrival order.
+
+    The read messages are kept according to a retention policy:
+        KEEP_ALL: every read message is kept in memory
+        KEEP_LAST: only the last max_read_messages read messages are kept
+        UNFINISHED_DISCUSSIONS: the read messages of a sender are dropped when the
+            discussion with it is over (see release_messages_from_exp)
+        SPILL_TO_DISK: the last max_read_messages read messages are kept in memory and
+            the older ones are appended to an on-disk log (spill_path)
+
     attr:
-        unread_messages: The list of unread messages
-        read_messages: The list of read messages
+        unread_messages: The unread messages (arrival number -> message)
+        read_messages: The read messages still in memory
+        retention_policy: The policy used to keep the read messages
+        max_read_messages: The number of read messages kept in memory (if bounded)
+        spilled_messages: The on-disk log of the evicted messages (SPILL_TO_DISK)
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        retention_policy: RetentionPolicy = RetentionPolicy.KEEP_ALL,
+        max_read_messages: Optional[int] = None,
+        spill_path: Optional[str] = None,
+    ):
         """Create a new Mailbox."""
-        self.__unread_messages = []
-        self.__read_messages = []
+        if retention_policy == RetentionPolicy.KEEP_LAST and max_read_messages is None:
+            raise ValueError("KEEP_LAST needs max_read_messages")
+        if retention_policy == RetentionPolicy.SPILL_TO_DISK and spill_path is None:
+            raise ValueError("SPILL_TO_DISK needs spill_path")
+        self.__retention_policy = retention_policy
+        self.__max_read_messages = max_read_messages or 0
+        self.__spill_path = spill_path
+        self.__spilled_messages: Optional[MessageLog] = None
+        self.__unread_messages: Dict[int, Message] = OrderedDict()
+        self.__unread_by_performative: Dict[MessagePerformative, Dict] = {}
+        self.__unread_by_exp: Dict[object, Dict] = {}
+        self.__unread_by_performative_exp: Dict[tuple, Dict] = {}
+        self.__read_messages: Deque[Message] = deque()
+        self.__read_by_performative: Dict[MessagePerformative, Deque] = defaultdict(
+            deque
+        )
+        self.__read_by_exp: Dict[object, Deque] = defaultdict(deque)
+        self.__nbr_received = 0
 
     def receive_messages(self, message):
         """Receive a message and add it in the unread messages list."""
-        self.__unread_messages.append(message)
+        number = self.__nbr_received
+        self.__nbr_received += 1
+        performative, exp = message.get_performative(), message.get_exp()
+        self.__unread_messages[number] = message
+        for index, key in (
+            (self.__unread_by_performative, performative),
+            (self.__unread_by_exp, exp),
+            (self.__unread_by_performative_exp, (performative, exp)),
+        ):
+            if key not in index:
+                index[key] = OrderedDict()
+            index[key][number] = message
+
+    def receive_message_batch(self, messages):
+        """Receive several messages at once (in the given order)."""
+        for message in messages:
+            self.receive_messages(message)
+
+    def __mark_as_read(self, number: int) -> Message:
+        """Move an unread message to the read messages."""
+        message = self.__unread_messages.pop(number)
+        performative, exp = message.get_performative(), message.get_exp()
+        for index, key in (
+            (self.__unread_by_performative, performative),
+            (self.__unread_by_exp, exp),
+            (self.__unread_by_performative_exp, (performative, exp)),
+        ):
+            messages = index[key]
+            del messages[number]
+            if not messages:
+                del index[key]
+        self.__store_read_message(message)
+        self.__apply_retention_policy()
+        return message
+
+    def __store_read_message(self, message: Message) -> None:
+        """Add a message to the read messages and their indexes."""
+        self.__read_messages.append(message)
+        self.__read_by_performative[message.get_performative()].append(message)
+        self.__read_by_exp[message.get_exp()].append(message)
+
+    def __apply_retention_policy(self) -> None:
+        """Evict the oldest read messages beyond max_read_messages (if bounded)."""
+        if self.__retention_policy not in {
+            RetentionPolicy.KEEP_LAST,
+            RetentionPolicy.SPILL_TO_DISK,
+        }:
+            return
+        evicted_messages = []
+        while len(self.__read_messages) > self.__max_read_messages:
+            # The oldest read message is also the oldest one in each read index
+            message = self.__read_messages.popleft()
+            for index, key in (
+                (self.__read_by_performative, message.get_performative()),
+                (self.__read_by_exp, message.get_exp()),
+            ):
+                index[key].popleft()
+                if not index[key]:
+                    del index[key]
+            evicted_messages.append(message)
+        if not evicted_messages:
+            return
+        if self.__retention_policy == RetentionPolicy.SPILL_TO_DISK:
+            if self.__spilled_messages is None:
+                self.__spilled_messages = MessageLog(self.__spill_path)
+            self.__spilled_messages.extend(evicted_messages)
+
+    def release_messages_from_exp(self, exp) -> None:
+        """Drop the read messages of a sender whose discussion is over.
+
+        Only used with the UNFINISHED_DISCUSSIONS policy (no-op otherwise).
+        """
+        if self.__retention_policy != RetentionPolicy.UNFINISHED_DISCUSSIONS:
+            return
+        if self.__read_by_exp.pop(exp, None) is None:
+            return
+        self.__read_messages = deque(
+            message for message in self.__read_messages if message.get_exp() != exp
+        )
+        for performative in list(self.__read_by_performative):
+            messages = deque(
+                message
+                for message in self.__read_by_performative[performative]
+                if message.get_exp() != exp
+            )
+            if messages:
+                self.__read_by_performative[performative] = messages
+            else:
+                del self.__read_by_performative[performative]
+
+    def get_spilled_messages(
+        self, start: int = 0, stop: Optional[int] = None, exp=None
+    ) -> List[Message]:
+        """Return a page of the messages spilled to disk (optionally from one sender)."""
+        if self.__spilled_messages is None:
+            return []
+        return list(self.__spilled_messages.iter_messages(start, stop, exp))
+
+    def close(self) -> None:
+        """Release the on-disk log of the spilled messages, if any."""
+        if self.__spilled_messages is not None:
+            self.__spilled_messages.close()
 
     def get_new_messages(self):
         """Return all the messages from unread messages list."""
-        unread_messages = self.__unread_messages.copy()
-        if len(unread_messages) > 0:
-            for messages in unread_messages:
-                self.__read_messages.append(messages)
+        unread_messages = list(self.__unread_messages.values())
+        for message in unread_messages:
+            self.__store_read_message(message)
+        self.__apply_retention_policy()
 
         self.__unread_messages.clear()
+        self.__unread_by_performative.clear()
+        self.__unread_by_exp.clear()
+        self.__unread_by_performative_exp.clear()
         return unread_messages
 
-    def get_messages(self):
-        """Return all the messages from both unread and read messages list."""
+    def get_messages(self, include_spilled: bool = False):
+        """Return all the messages from both unread and read messages list.
+
+        The messages spilled to disk are loaded first if include_spilled is set.
+        """
         if len(self.__unread_messages) > 0:
             self.get_new_messages()
-        return self.__read_messages
+        if include_spilled:
+            return [*self.get_spilled_messages(), *self.__read_messages]
+        return list(self.__read_messages)
 
     def get_messages_from_performative(self, performative: MessagePerformative):
         """Return a list of messages which have the same performative."""
-        messages_from_performative = []
-        for message in self.__unread_messages + self.__read_messages:
-            if message.get_performative() == performative:
-                messages_from_performative.append(message)
-        return messages_from_performative
+        return [
+            *self.__unread_by_performative.get(performative, {}).values(),
+            *self.__read_by_performative.get(performative, []),
+        ]
 
-    def get_messages_from_exp(self, exp):
+    def get_messages_from_exp(self, exp, include_spilled: bool = False):
         """Return a list of messages which have the same sender."""
-        messages_from_exp = []
-        for message in self.__unread_messages + self.__read_messages:
-            if message.get_exp() == exp:
-                messages_from_exp.append(message)
-        return messages_from_exp
+        return [
+            *(self.get_spilled_messages(exp=exp) if include_spilled else []),
+            *self.__unread_by_exp.get(exp, {}).values(),
+            *self.__read_by_exp.get(exp, []),
+        ]
 
-    def __get_unread_messages_with_performative(
+    def __get_unread_index(
         self, performative: MessagePerformative, agent_id: str = None
-    ) -> List[Message]:
-        """Get the unread messages with performative."""
-        messages_from_performative = []
-        for message in self.__unread_messages:
-            if message.get_performative() == performative:
-                if agent_id is None or message.get_exp() == agent_id:
-                    messages_from_performative.append(message)
-        return messages_from_performative
+    ) -> Dict[int, Message]:
+        """Get the unread messages with performative (and sender)."""
+        if agent_id is None:
+            return self.__unread_by_performative.get(performative, {})
+        return self.__unread_by_performative_exp.get((performative, agent_id), {})
+
+    def has_unread_messages(self) -> bool:
+        """Check if there is any unread message."""
+        return len(self.__unread_messages) > 0
 
     def has_unread_message_with_performative(
         self, performative: MessagePerformative, agent_id: str = None
     ) -> bool:
         """Check if unread messages with this performative."""
-        return (
-            len(self.__get_unread_messages_with_performative(performative, agent_id))
-            > 0
-        )
+        return len(self.__get_unread_index(performative, agent_id)) > 0
+
+    def pop_unread_messages(
+        self, performative: MessagePerformative, agent_id: str = None
+    ) -> List[Message]:
+        """Mark as read and return all the unread messages with this performative."""
+        messages = self.__get_unread_index(performative, agent_id)
+        return [self.__mark_as_read(number) for number in list(messages)]
 
     def get_last_unread_message_with_performative(
         self, performative: MessagePerformative, agent_id: str = None
     ) -> Optional[Message]:
         """Get the last unread message with this performative."""
-        for message_idx, message in enumerate(self.__unread_messages):
-            if message.get_performative() == performative:
-                if agent_id is None or agent_id == message.get_exp():
-                    self.__read_messages.append(message)
-                    return self.__unread_messages.pop(message_idx)
-        return None
+        messages = self.__get_unread_index(performative, agent_id)
+        if len(messages) == 0:
+            return None
+        return self.__mark_as_read(next(iter(messages)))
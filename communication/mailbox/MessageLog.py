@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import os
+import pickle
+import struct
+import tempfile
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from communication.message.Message import Message
+
+RECORD_HEADER = struct.Struct("<I")
+
+
+class MessageLog:
+    """MessageLog class.
+    Class implementing an append-only on-disk log of messages. Each record is a pickled
+    message prefixed by its length; only the record offsets are kept in memory.
+
+    The file is only open while records are appended or read, so that many logs (one
+    per agent) can exist at once without running out of file descriptors.
+
+    A pickled log carries the content of its file; the unpickled log writes it to a new
+    temporary file next to the original one (which may still be in use). The log owns
+    that temporary file and deletes it on close(), whereas the file of a log created
+    with a path belongs to the caller and is kept.
+
+    attr:
+        path: the path of the log file
+        size: the size of the log file
+        offsets: the offset of each record in the file
+        records_by_exp: the record numbers of each sender
+    """
+
+    def __init__(self, path: str):
+        """Create a new (empty) MessageLog, truncating the file if it exists."""
+        self.__path = path
+        with open(path, "wb"):
+            pass
+        self.__size = 0
+        self.__owns_file = False
+        self.__offsets: List[int] = []
+        self.__records_by_exp: Dict[object, List[int]] = defaultdict(list)
+
+    def __len__(self) -> int:
+        return len(self.__offsets)
+
+    @property
+    def path(self) -> str:
+        """Return the path of the log file."""
+        return self.__path
+
+    def append(self, message: Message) -> None:
+        """Append a message at the end of the log."""
+        self.extend([message])
+
+    def extend(self, messages: Iterable[Message]) -> None:
+        """Append messages at the end of the log (opening the file once)."""
+        with open(self.__path, "ab") as log_file:
+            for message in messages:
+                data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+                self.__records_by_exp[message.get_exp()].append(len(self.__offsets))
+                self.__offsets.append(self.__size)
+                log_file.write(RECORD_HEADER.pack(len(data)))
+                log_file.write(data)
+                self.__size += RECORD_HEADER.size + len(data)
+
+    def read(self, record: int) -> Message:
+        """Read one message from the log."""
+        with open(self.__path, "rb") as log_file:
+            return self.__read_record(log_file, record)
+
+    def __read_record(self, log_file, record: int) -> Message:
+        """Read one message from the open log file."""
+        log_file.seek(self.__offsets[record])
+        (size,) = RECORD_HEADER.unpack(log_file.read(RECORD_HEADER.size))
+        return pickle.loads(log_file.read(size))
+
+    def iter_messages(
+        self, start: int = 0, stop: Optional[int] = None, exp=None
+    ) -> Iterator[Message]:
+        """Iterate over a page of the log (optionally only the messages of one sender)."""
+        records = (
+            range(len(self.__offsets))
+            if exp is None
+            else self.__records_by_exp.get(exp, [])
+        )
+        records = records[start:stop]
+        if not records:
+            return
+        with open(self.__path, "rb") as log_file:
+            for record in records:
+                yield self.__read_record(log_file, record)
+
+    def __getstate__(self):
+        """Return the state of the log, with the content of its file."""
+        state = self.__dict__.copy()
+        with open(self.__path, "rb") as log_file:
+            state["_MessageLog__data"] = log_file.read(self.__size)
+        return state
+
+    def __setstate__(self, state):
+        """Restore the log in a new file."""
+        data = state.pop("_MessageLog__data")
+        self.__dict__.update(state)
+        file_descriptor, self.__path = tempfile.mkstemp(
+            prefix=os.path.basename(self.__path) + ".",
+            dir=os.path.dirname(self.__path) or None,
+        )
+        with os.fdopen(file_descriptor, "wb") as log_file:
+            log_file.write(data)
+        self.__owns_file = True
+
+    def close(self) -> None:
+        """Release the log (delete its file if it is a temporary file of the log)."""
+        if self.__owns_file and os.path.exists(self.__path):
+            os.remove(self.__path)
@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+
+from enum import Enum
+
+
+class RetentionPolicy(Enum):
+    """RetentionPolicy enum class.
+    Enumeration containing the possible policies to keep the read messages of a mailbox.
+    """
+
+    KEEP_ALL = 0
+    KEEP_LAST = 1
+    UNFINISHED_DISCUSSIONS = 2
+    SPILL_TO_DISK = 3
+
+    def __str__(self):
+        """Returns the name of the enum item."""
+        return "{0}".format(self.name)
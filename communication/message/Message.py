@@ -7,11 +7,15 @@ class Message:
     Class implementing the message object which is exchanged between agents through a message service
     during communication.
 
+    A message sent to several agents (multicast) is a single object, shared by the
+    mailboxes of all its receivers.
+
     attr:
         from_agent: the sender of the message (id)
-        to_agent: the receiver of the message (id)
+        to_agent: the receiver of the message (id), or a tuple of ids for a multicast
         message_performative: the performative of the message
         content: the content of the message
+        conversation_id: the conversation the message belongs to (None if unspecified)
     """
 
     def __init__(
@@ -20,12 +24,14 @@ class Message:
         to_agent: int,
         message_performative: MessagePerformative,
         content,
+        conversation_id=None,
     ):
         """Create a new message."""
         self.__from_agent = from_agent
         self.__to_agent = to_agent
         self.__message_performative = message_performative
         self.__content = content
+        self.__conversation_id = conversation_id
 
     def __str__(self):
         """Return Message as a String."""
@@ -48,6 +54,14 @@ class Message:
         """Return the receiver of the message."""
         return self.__to_agent
 
+    def is_multicast(self):
+        """Return whether the message is sent to several agents."""
+        return isinstance(self.__to_agent, tuple)
+
+    def get_recipients(self):
+        """Return the receivers of the message as a tuple."""
+        return self.__to_agent if self.is_multicast() else (self.__to_agent,)
+
     def get_performative(self):
         """Return the performative of the message."""
         return self.__message_performative
@@ -55,3 +69,7 @@ class Message:
     def get_content(self):
         """Return the content of the message."""
         return self.__content
+
+    def get_conversation_id(self):
+        """Return the conversation the message belongs to."""
+        return self.__conversation_id
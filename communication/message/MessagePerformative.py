@@ -15,6 +15,7 @@ class MessagePerformative(Enum):
     ARGUE = 105
     QUERY_REF = 106
     INFORM_REF = 107
+    CANCEL = 108
 
     def __str__(self):
         """Returns the name of the enum item."""
@@ -1,65 +1,178 @@
 #!/usr/bin/env python3
 
+import heapq
 import logging
+from collections import Counter
 
 
 class MessageService:
     """MessageService class.
     Class implementing the message service used to dispatch messages between communicating agents.
 
-    Not intended to be created more than once: it's a singleton.
+    Each model owns its message service (model.message_service), which its agents use,
+    so that several models can run in the same process.
+
+    Without instant delivery, the messages wait in a heap keyed on (delivery step,
+    performative priority, sending order) and each call to dispatch_messages (once per
+    model step) delivers the messages that are due. By default a message sent during a
+    step is delivered at the next dispatch; link latencies (in steps) delay it further.
+
+    If the scheduler has a wake(agent_id) method (EventDrivenActivation), it is called
+    for each receiver.
 
     attr:
         scheduler: the scheduler of the sma (Scheduler)
-        messages_to_proceed: the list of message to proceed mailbox of the agent (list)
+        messages_to_proceed: the heap of (step, priority, order, receiver, message) (list)
+        step: the number of dispatch_messages calls so far (int)
+        latency: the default latency, in steps or as a function (message, receiver) -> int
+        link_latencies: the latency of specific (sender, receiver) links (dict)
+        priorities: the priority of each performative, lower first (dict)
+        agents: the directory of the scheduler agents by unique id (the dict of mesa's
+            scheduler, so it follows the agents added to or removed from the scheduler)
+        batch_sizes: the number of deferred deliveries of each batch size (Counter)
+        groups: the named groups of agent ids that can be used as recipients (dict)
     """
 
-    __instance = None
-
-    @staticmethod
-    def get_instance():
-        """Static access method."""
-        return MessageService.__instance
-
-    def __init__(self, scheduler, instant_delivery=True, force=True):
+    def __init__(self, scheduler, instant_delivery=True):
         """Create a new MessageService object."""
-        if MessageService.__instance is not None and not force:
-            raise Exception("This class is a singleton!")
-        else:
-            MessageService.__instance = self
-            self.__scheduler = scheduler
-            self.__instant_delivery = instant_delivery
-            self.__messages_to_proceed = []
+        self.__scheduler = scheduler
+        self.__wake = getattr(scheduler, "wake", None)
+        self.__instant_delivery = instant_delivery
+        self.__messages_to_proceed = []
+        self.__step = 0
+        self.__nbr_queued = 0
+        self.__latency = 0
+        self.__link_latencies = {}
+        self.__priorities = {}
+        self.__batch_sizes = Counter()
+        self.__groups = {}
 
     def set_instant_delivery(self, instant_delivery):
         """Set the instant delivery parameter."""
         self.__instant_delivery = instant_delivery
 
+    def set_latency(self, latency):
+        """Set the default latency: a number of steps or a function (message, receiver) -> int."""
+        self.__latency = latency
+
+    def set_link_latency(self, from_agent, to_agent, latency):
+        """Set the latency of one link (steps or function), overriding the default one."""
+        self.__link_latencies[(from_agent, to_agent)] = latency
+
+    def set_performative_priority(self, performative, priority: int):
+        """Set the priority of a performative (lower is delivered first in a step)."""
+        self.__priorities[performative] = priority
+
+    def get_latency(self, message, to_agent) -> int:
+        """Return the latency (in steps) of a message for one of its receivers."""
+        latency = self.__link_latencies.get(
+            (message.get_exp(), to_agent), self.__latency
+        )
+        return latency(message, to_agent) if callable(latency) else latency
+
+    def get_nbr_pending_messages(self) -> int:
+        """Return the number of deliveries waiting in the queue."""
+        return len(self.__messages_to_proceed)
+
     def send_message(self, message):
         """Dispatch message if instant delivery active, otherwise add the message to proceed list."""
         if self.__instant_delivery:
             self.dispatch_message(message)
-        else:
-            self.__messages_to_proceed.append(message)
+            return
+        priority = self.__priorities.get(message.get_performative(), 0)
+        for agent_name in message.get_recipients():
+            heapq.heappush(
+                self.__messages_to_proceed,
+                (
+                    self.__step + self.get_latency(message, agent_name),
+                    priority,
+                    self.__nbr_queued,
+                    agent_name,
+                    message,
+                ),
+            )
+            self.__nbr_queued += 1
 
-    def dispatch_message(self, message):
-        """Dispatch the message to the right agent."""
+    @staticmethod
+    def log_message(message):
+        """Log a dispatched message."""
         logging.info(
-            f"Agent {message.get_exp()} -> Agent {message.get_dest()}: {message.get_performative()} : {message.get_content()}"
+            "Agent %s -> Agent %s: %s : %s",
+            message.get_exp(),
+            message.get_dest(),
+            message.get_performative(),
+            message.get_content(),
         )
-        self.find_agent_from_name(message.get_dest()).receive_message(message)
+
+    def dispatch_message(self, message):
+        """Dispatch the message to the right agent(s)."""
+        self.log_message(message)
+        for agent_name in message.get_recipients():
+            self.find_agent_from_name(agent_name).receive_message(message)
+            if self.__wake is not None:
+                self.__wake(agent_name)
 
     def dispatch_messages(self):
-        """Proceed each message received by the message service."""
-        if len(self.__messages_to_proceed) > 0:
-            for message in self.__messages_to_proceed:
-                self.dispatch_message(message)
+        """Proceed the messages that are due at this step.
+
+        The messages are grouped by receiver and each mailbox gets its batch at once
+        (in priority then sending order).
+        """
+        batches = {}
+        queue = self.__messages_to_proceed
+        while queue and queue[0][0] <= self.__step:
+            _, _, _, agent_name, message = heapq.heappop(queue)
+            batches.setdefault(agent_name, []).append(message)
+        self.__step += 1
+
+        log_messages = logging.getLogger().isEnabledFor(logging.INFO)
+        for agent_name, messages in batches.items():
+            if log_messages:
+                for message in messages:
+                    self.log_message(message)
+            self.find_agent_from_name(agent_name).receive_messages(messages)
+            if self.__wake is not None:
+                self.__wake(agent_name)
+            self.__batch_sizes[len(messages)] += 1
+
+    def get_batch_sizes(self):
+        """Return the number of deferred deliveries of each batch size."""
+        return self.__batch_sizes
+
+    def set_group(self, group_name, agent_names):
+        """Define (or replace) a named group of recipients."""
+        self.__groups[group_name] = tuple(agent_names)
+
+    def get_group(self, group_name):
+        """Return the agent ids of a named group."""
+        if group_name not in self.__groups:
+            raise ValueError(f"No group with name {group_name}")
+        return self.__groups[group_name]
+
+    @property
+    def agents(self):
+        """Return the agents of the scheduler by unique id."""
+        # mesa's schedulers keep their agents in a dict keyed by unique id
+        return self.__scheduler._agents  # pylint: disable=protected-access
+
+    def get_agent_names(self):
+        """Return the ids of all the agents of the scheduler."""
+        return self.agents.keys()
+
+    def resolve_recipients(self, recipients, sender=None):
+        """Return the tuple of agent ids designated by recipients.
 
-        self.__messages_to_proceed.clear()
+        recipients can be None (every agent but the sender), a group name or a list of ids.
+        """
+        if recipients is None:
+            return tuple(name for name in self.get_agent_names() if name != sender)
+        if isinstance(recipients, str):
+            return self.get_group(recipients)
+        return tuple(recipients)
 
     def find_agent_from_name(self, agent_name):
         """Return the agent according to the agent name given."""
-        for agent in self.__scheduler.agents:
-            if agent.unique_id == agent_name:
-                return agent
-        raise ValueError(f"No agent with name {agent_name}")
+        agent = self.agents.get(agent_name)
+        if agent is None:
+            raise ValueError(f"No agent with name {agent_name}")
+        return agent
@@ -5,15 +5,20 @@ class Item:
     """Item class.
     This class implements the objects about which the argument will be conducted.
 
+    Two items are equal (and hash the same) when they have the same name.
+
     attr:
         name: the name of the item
         description: the description of the item
+        id: the integer id given by an ItemCatalog (None if not registered)
     """
 
     def __init__(self, name: str, description: str):
         """Creates a new Item."""
         self.__name = name
         self.__description = description
+        self.__hash = hash(name)
+        self.__id = None
 
     def __str__(self):
         """Returns Item as a String."""
@@ -22,6 +27,24 @@ class Item:
     def __repr__(self) -> str:
         return self.__str__()
 
+    def __eq__(self, __o: object) -> bool:
+        if self is __o:
+            return True
+        if not isinstance(__o, Item):
+            return NotImplemented
+        return self.__name == __o.get_name()
+
+    def __hash__(self) -> int:
+        return self.__hash
+
+    def get_id(self):
+        """Returns the id of the item in its catalog (None if not registered)."""
+        return self.__id
+
+    def set_id(self, item_id: int):
+        """Sets the id of the item (called by the ItemCatalog)."""
+        self.__id = item_id
+
     def get_name(self):
         """Returns the name of the item."""
         return self.__name
@@ -36,12 +59,4 @@ class Item:
 
     def get_score(self, preferences):
         """Returns the score of the Item according to agent preferences."""
-        criterion_weight = 100
-        sum_result = 0
-        for criterion_name in preferences.get_criterion_name_list():
-            sum_result = (
-                sum_result
-                + criterion_weight * self.get_value(preferences, criterion_name).value
-            )
-            criterion_weight = criterion_weight / 2
-        return sum_result
+        return preferences.get_score(self)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+from typing import Dict, List
+
+from communication.preferences.Item import Item
+
+
+class ItemCatalog:
+    """ItemCatalog class.
+    This class implements the registry of the items of a model: each item gets a stable
+    small integer id (its position in the catalog).
+
+    attr:
+        items: the registered items, indexed by id
+        ids: the id of each item name
+    """
+
+    def __init__(self):
+        """Creates a new, empty ItemCatalog."""
+        self.__items: List[Item] = []
+        self.__ids: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.__items)
+
+    def register(self, item: Item) -> int:
+        """Register an item and return its id."""
+        if item.get_name() in self.__ids:
+            raise ValueError(f"An item named {item.get_name()} is already registered")
+        item_id = len(self.__items)
+        item.set_id(item_id)
+        self.__items.append(item)
+        self.__ids[item.get_name()] = item_id
+        return item_id
+
+    def get_items(self) -> List[Item]:
+        """Returns the registered items (ordered by id)."""
+        return self.__items
+
+    def get_item(self, item_id: int) -> Item:
+        """Returns the item with the given id."""
+        return self.__items[item_id]
+
+    def get_id(self, item: Item) -> int:
+        """Returns the id of an item (registered or with the same name)."""
+        if item.get_name() not in self.__ids:
+            raise ValueError(f"No item named {item.get_name()}")
+        return self.__ids[item.get_name()]
+
+    def get_index(self) -> Dict[str, int]:
+        """Returns the id of each item name."""
+        return self.__ids
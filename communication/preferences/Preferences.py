@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 
-from typing import List, Optional
+from collections import OrderedDict
+from typing import Container, Dict, List, Optional, Tuple
 
+import numpy as np
 from prettytable import PrettyTable
 
 from communication.preferences.CriterionName import CriterionName
@@ -9,54 +11,279 @@ from communication.preferences.CriterionValue import CriterionValue
 from communication.preferences.Item import Item
 from communication.preferences.Value import Value
 
+# Marker for a missing (item, criterion) cell in the value matrix
+MISSING_VALUE = -1
+VALUE_FROM_INT: Dict[int, Value] = {value.value: value for value in Value}
+CRITERION_NAMES: List[CriterionName] = list(CriterionName)
+# Number of item lists whose ranking is kept in cache (the last used ones)
+MAX_CACHED_RANKINGS = 8
+
+
+class _ItemRanking:
+    """Ranking of an item list, sorted by decreasing score.
+
+    attr:
+        item_list: the ranked list (kept to check the cache key)
+        version: the preferences version the ranking was built for
+        sorted_items: the items from best to worst (stable for ties)
+        ranks: the rank of each item name (first occurrence)
+        buckets: for each criterion, the items grouped by value from the best value to
+            the worst one (built on demand, items in list order inside a bucket)
+    """
+
+    def __init__(self, item_list: List[Item], version: int, preferences):
+        """Sort the item list once."""
+        self.item_list = item_list
+        self.size = len(item_list)
+        self.version = version
+        self.preferences = preferences
+        self.sorted_items: List[Item] = sorted(
+            item_list, key=preferences.get_score, reverse=True
+        )
+        self.ranks: Dict[str, int] = {}
+        for rank, item in enumerate(self.sorted_items):
+            self.ranks.setdefault(item.get_name(), rank)
+        self.buckets: Dict[CriterionName, List[Tuple[Value, List[Item]]]] = {}
+
+    def get_buckets(
+        self, criterion_name: CriterionName
+    ) -> List[Tuple[Value, List[Item]]]:
+        """Returns the items grouped by value on a criterion, best value first."""
+        if criterion_name not in self.buckets:
+            items_by_value: Dict[Value, List[Item]] = {}
+            for item in self.item_list:
+                value = self.preferences.get_value(item, criterion_name)
+                items_by_value.setdefault(value, []).append(item)
+            self.buckets[criterion_name] = sorted(
+                items_by_value.items(), key=lambda bucket: bucket[0], reverse=True
+            )
+        return self.buckets[criterion_name]
+
+    def is_valid_for(self, item_list: List[Item], version: int) -> bool:
+        """Check that the ranking still matches the item list and preferences."""
+        return (
+            self.item_list is item_list
+            and self.size == len(item_list)
+            and self.version == version
+        )
+
 
 class Preferences:
     """Preferences class.
     This class implements the preferences of an agent.
 
+    The values are stored in a dense items x criteria integer matrix: each item is mapped
+    to a row (by name) and each criterion to the column given by its enum value.
+    Item scores and rankings are cached and invalidated by a version number bumped on
+    each mutation (add_criterion_value and set_criterion_name_list). The rankings of
+    the MAX_CACHED_RANKINGS last used item lists are kept (LRU), keyed by the identity
+    of the list: a ranked item list must not be mutated in place (only a change of its
+    length is detected), pass a new list instead.
+
     attr:
         criterion_name_list: the list of criterion name (ordered by importance)
-        criterion_value_list: the list of criterion value
+        item_index: the row of each item in the value matrix (by item name)
+        values: the items x criteria matrix of values (MISSING_VALUE when unset)
+        version: the number of mutations, used to invalidate the caches
     """
 
     def __init__(self):
         """Creates a new Preferences object."""
         self.__criterion_name_list: List[CriterionName] = []  # In order
-        self.__criterion_value_list: List[CriterionValue] = []
+        self.__items: List[Item] = []
+        self.__item_index: Dict[str, int] = {}
+        self.__values = np.full((0, len(CRITERION_NAMES)), MISSING_VALUE, dtype=np.int8)
+        self.__owns_index = True
+        self.__version = 0
+        self.__scores: Optional[List[float]] = None
+        self.__scores_version = -1
+        self.__rankings: "OrderedDict[int, _ItemRanking]" = OrderedDict()
+
+    def __getstate__(self):
+        """Return the state without the caches (rebuilt on demand)."""
+        state = self.__dict__.copy()
+        state["_Preferences__scores"] = None
+        state["_Preferences__scores_version"] = -1
+        state["_Preferences__rankings"] = OrderedDict()
+        return state
+
+    @classmethod
+    def from_value_matrix(
+        cls,
+        criterion_name_list: List[CriterionName],
+        items: List[Item],
+        values: np.ndarray,
+        item_index: Optional[Dict[str, int]] = None,
+    ) -> "Preferences":
+        """Creates preferences backed by an existing items x criteria matrix.
+
+        The matrix (and the item index, if given) is used as is, without copy: it can be
+        a view into a larger array shared by several agents. They are copied the first
+        time a new item has to be added.
+        """
+        preferences = cls()
+        preferences.__criterion_name_list = criterion_name_list
+        preferences.__items = items
+        preferences.__values = values
+        if item_index is None:
+            item_index = {item.get_name(): row for row, item in enumerate(items)}
+        preferences.__item_index = item_index
+        preferences.__owns_index = False
+        return preferences
+
+    def get_version(self) -> int:
+        """Returns the version of the preferences (bumped on each mutation)."""
+        return self.__version
 
     def get_criterion_name_list(self) -> List[CriterionName]:
         """Returns the list of criterion name."""
         return self.__criterion_name_list
 
+    def get_items(self) -> List[Item]:
+        """Returns the items having at least one value (in row order)."""
+        return self.__items
+
+    def get_value_matrix(self) -> np.ndarray:
+        """Returns the items x criteria matrix of values (rows follow get_items)."""
+        return self.__values[: len(self.__items)]
+
+    def get_item_row(self, item: Item) -> Optional[int]:
+        """Returns the row of an item in the value matrix (None if unknown)."""
+        return self.__item_index.get(item.get_name())
+
     def get_criterion_for_item(self, item: Item) -> List[CriterionValue]:
         """Get all preferences for one item."""
-        return list(
-            filter(
-                lambda x: x.get_item().get_name() == item.get_name(),
-                self.__criterion_value_list,
+        row = self.get_item_row(item)
+        if row is None:
+            return []
+        return [
+            CriterionValue(
+                self.__items[row], CRITERION_NAMES[column], VALUE_FROM_INT[value]
             )
-        )
+            for column, value in enumerate(self.__values[row].tolist())
+            if value != MISSING_VALUE
+        ]
 
     def get_criterion_value_list(self) -> List[CriterionValue]:
         """Returns the list of criterion value."""
-        return self.__criterion_value_list
+        return [
+            criterion_value
+            for item in self.__items
+            for criterion_value in self.get_criterion_for_item(item)
+        ]
 
     def set_criterion_name_list(self, criterion_name_list: List[CriterionName]) -> None:
         """Sets the list of criterion name."""
         self.__criterion_name_list = criterion_name_list
+        self.__version += 1
 
     def add_criterion_value(self, criterion_value: CriterionValue) -> None:
-        """Adds a criterion value in the list."""
-        self.__criterion_value_list.append(criterion_value)
+        """Adds a criterion value in the matrix."""
+        item = criterion_value.get_item()
+        row = self.get_item_row(item)
+        if row is None:
+            row = self.__add_item(item)
+        self.__values[
+            row, criterion_value.get_criterion_name().value
+        ] = criterion_value.get_value().value
+        self.__version += 1
 
-    def get_value(self, item: Item, criterion_name: str) -> Optional[Value]:
+    def __add_item(self, item: Item) -> int:
+        """Allocate a row for a new item (the matrix grows by doubling)."""
+        if not self.__owns_index:
+            self.__items = list(self.__items)
+            self.__item_index = dict(self.__item_index)
+            self.__owns_index = True
+        row = len(self.__items)
+        if row == self.__values.shape[0]:
+            grown = np.full(
+                (max(1, 2 * row), len(CRITERION_NAMES)), MISSING_VALUE, dtype=np.int8
+            )
+            grown[:row] = self.__values
+            self.__values = grown
+        self.__items.append(item)
+        self.__item_index[item.get_name()] = row
+        return row
+
+    def get_value(self, item: Item, criterion_name: CriterionName) -> Optional[Value]:
         """Gets the value for a given item and a given criterion name."""
-        for value in self.__criterion_value_list:
-            if (
-                value.get_item() == item
-                and value.get_criterion_name() == criterion_name
-            ):
-                return value.get_value()
+        row = self.__item_index.get(item.get_name())
+        if row is None:
+            return None
+        return VALUE_FROM_INT.get(int(self.__values[row, criterion_name.value]))
+
+    def get_score(self, item: Item) -> float:
+        """Returns the score of an item (cached until the next mutation)."""
+        row = self.get_item_row(item)
+        if row is None:
+            raise ValueError(f"No preferences for item {item}")
+        if self.__scores_version != self.__version:
+            # Weight 100 for the most important criterion, halved for each next one
+            weights = np.zeros(len(CRITERION_NAMES))
+            for rank, criterion_name in enumerate(self.__criterion_name_list):
+                weights[criterion_name.value] = 100 / 2**rank
+            self.__scores = (self.get_value_matrix() @ weights).tolist()
+            self.__scores_version = self.__version
+        return self.__scores[row]
+
+    def get_ranking(self, item_list: List[Item]) -> _ItemRanking:
+        """Returns the (cached) ranking of an item list (which must not be mutated)."""
+        ranking = self.__rankings.get(id(item_list))
+        if ranking is not None and ranking.is_valid_for(item_list, self.__version):
+            self.__rankings.move_to_end(id(item_list))
+            return ranking
+        ranking = _ItemRanking(item_list, self.__version, self)
+        self.__rankings[id(item_list)] = ranking
+        if len(self.__rankings) > MAX_CACHED_RANKINGS:
+            self.__rankings.popitem(last=False)
+        return ranking
+
+    def get_item_rank(self, item: Item, item_list: List[Item]) -> int:
+        """Returns the rank of an item in a list (0 for the most preferred)."""
+        ranks = self.get_ranking(item_list).ranks
+        if item.get_name() not in ranks:
+            raise ValueError(f"{item} is not in the item list")
+        return ranks[item.get_name()]
+
+    def get_top_items(self, item_list: List[Item], k: int) -> List[Item]:
+        """Returns the k most preferred items from a list."""
+        return self.get_ranking(item_list).sorted_items[:k]
+
+    def get_best_alternative_on_criterion(
+        self,
+        item_list: List[Item],
+        criterion_name: CriterionName,
+        value: Value,
+        excluded: Container[Item] = (),
+    ) -> Optional[Item]:
+        """Returns the item with the best value on a criterion, if better than value.
+
+        The excluded items are skipped; ties are broken by the order of item_list.
+        """
+        for bucket_value, items in self.get_ranking(item_list).get_buckets(
+            criterion_name
+        ):
+            if bucket_value <= value:
+                break
+            for item in items:
+                if item not in excluded:
+                    return item
+        return None
+
+    def get_best_alternative(
+        self,
+        item_list: List[Item],
+        criterion_name: CriterionName,
+        value: Value,
+        excluded: Container[Item] = (),
+    ) -> Optional[Item]:
+        """Returns the most preferred item whose value on a criterion is better than value.
+
+        The excluded items are skipped.
+        """
+        for item in self.get_ranking(item_list).sorted_items:
+            if item not in excluded and self.get_value(item, criterion_name) > value:
+                return item
         return None
 
     def is_preferred_criterion(
@@ -75,11 +302,7 @@ class Preferences:
 
     def most_preferred(self, item_list: List[Item]) -> Item:
         """Returns the most preferred item from a list."""
-        # To be completed
-        sorted_items = list(
-            sorted(item_list, key=lambda item: item.get_score(self), reverse=True)
-        )
-        return sorted_items[0]
+        return self.get_ranking(item_list).sorted_items[0]
 
     def is_item_among_top_10_percent(self, item: Item, item_list: List[Item]) -> bool:
         """
@@ -87,11 +310,13 @@ class Preferences:
 
         :return: a boolean, True means that the item is among the favourite ones
         """
-        sorted_items = list(
-            sorted(item_list, key=lambda item: item.get_score(self), reverse=True)
-        )
-        names = list(map(lambda x: x.get_name(), sorted_items))
-        return names.index(item.get_name()) < len(sorted_items) * 0.1
+        return self.is_item_among_top_percent(item, item_list, 10)
+
+    def is_item_among_top_percent(
+        self, item: Item, item_list: List[Item], percent: float
+    ) -> bool:
+        """Return whether a given item is among the top percent of the preferred items."""
+        return self.get_item_rank(item, item_list) < len(item_list) * percent / 100
 
     def __str__(self) -> str:
         order_str = ""
@@ -100,9 +325,7 @@ class Preferences:
 
         x = PrettyTable()
         x.field_names = ["Item name", *self.__criterion_name_list]
-        items = set([x.get_item() for x in self.__criterion_value_list])
-        items = list(sorted(items, key=lambda item: item.get_score(self), reverse=True))
-        for item in items:
+        for item in self.get_ranking(self.__items).sorted_items:
             values = [
                 self.get_value(item, criterion_name)
                 for criterion_name in self.__criterion_name_list
@@ -203,3 +426,34 @@ if __name__ == "__main__":
     assert not agent_pref.is_item_among_top_10_percent(
         electric_engine, [*[diesel_engine for _ in range(10)], electric_engine]
     )
+
+    assert agent_pref.get_value(Item("Hydrogen", ""), CriterionName.NOISE) is None
+    assert len(agent_pref.get_criterion_for_item(diesel_engine)) == 5
+    assert agent_pref.get_value_matrix().shape == (2, 5)
+
+    # The ranking is cached until the preferences change
+    item_list = [diesel_engine, electric_engine]
+    assert agent_pref.get_ranking(item_list) is agent_pref.get_ranking(item_list)
+    assert agent_pref.get_item_rank(electric_engine, item_list) == 1
+    assert agent_pref.get_top_items(item_list, 1) == [diesel_engine]
+    first_ranking = agent_pref.get_ranking(item_list)
+    other_lists = [[electric_engine] for _ in range(MAX_CACHED_RANKINGS)]
+    for other_list in other_lists:
+        agent_pref.get_ranking(other_list)
+        assert agent_pref.get_ranking(item_list) is first_ranking
+    agent_pref.set_criterion_name_list(
+        [CriterionName.ENVIRONMENT_IMPACT, CriterionName.NOISE]
+    )
+    assert agent_pref.most_preferred(item_list) == electric_engine
+    assert (
+        agent_pref.get_best_alternative_on_criterion(
+            item_list, CriterionName.NOISE, Value.VERY_BAD
+        )
+        == electric_engine
+    )
+    assert (
+        agent_pref.get_best_alternative(
+            item_list, CriterionName.DURABILITY, Value.GOOD, {electric_engine}
+        )
+        == diesel_engine
+    )
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from communication.preferences.CriterionName import CriterionName
+from communication.preferences.Item import Item
+from communication.preferences.Preferences import CRITERION_NAMES, Preferences
+from communication.preferences.Value import Value
+
+VALUE_INTS = np.array([value.value for value in Value], dtype=np.int8)
+
+
+class PreferencesGenerator:
+    """PreferencesGenerator class.
+    This class draws the random preferences of a whole population of agents at once.
+
+    attr:
+        items: the items the agents have preferences about
+        rng: the numpy random generator used for the draws
+        criterion_orders: the agents x criteria array of criterion indices (by importance)
+        values: the agents x items x criteria tensor of values
+    """
+
+    def __init__(
+        self,
+        items: List[Item],
+        rng: np.random.Generator,
+        item_index: Optional[Dict[str, int]] = None,
+    ):
+        """Creates a new PreferencesGenerator.
+
+        item_index gives the position of each item name in items (e.g. the ids of an
+        ItemCatalog); it is computed if not given.
+        """
+        self.items = items
+        self.rng = rng
+        if item_index is None:
+            item_index = {item.get_name(): row for row, item in enumerate(items)}
+        self.item_index = item_index
+        self.criterion_orders = np.empty((0, len(CRITERION_NAMES)), dtype=np.int64)
+        self.values = np.empty((0, len(items), len(CRITERION_NAMES)), dtype=np.int8)
+
+    def generate(self, nb_agents: int) -> List[Preferences]:
+        """Draw the preferences of nb_agents agents.
+
+        Each returned Preferences is a view into the values tensor.
+        """
+        nb_criteria = len(CRITERION_NAMES)
+        self.criterion_orders = np.argsort(
+            self.rng.random((nb_agents, nb_criteria)), axis=1
+        )
+        self.values = VALUE_INTS[
+            self.rng.integers(
+                len(VALUE_INTS), size=(nb_agents, len(self.items), nb_criteria)
+            )
+        ]
+        return [
+            Preferences.from_value_matrix(
+                self.get_criterion_name_list(agent_idx),
+                self.items,
+                self.values[agent_idx],
+                self.item_index,
+            )
+            for agent_idx in range(nb_agents)
+        ]
+
+    def get_criterion_name_list(self, agent_idx: int) -> List[CriterionName]:
+        """Returns the criterion order drawn for one agent."""
+        return [CRITERION_NAMES[column] for column in self.criterion_orders[agent_idx]]
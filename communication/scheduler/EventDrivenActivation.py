@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+from typing import Set
+
+from mesa.time import RandomActivation
+
+
+class EventDrivenActivation(RandomActivation):
+    """EventDrivenActivation class.
+    Scheduler activating, in random order, only the agents that have something to do.
+
+    An agent is awake when it is added, when the message service delivers a message to it
+    (wake), or when it still has pending work after its step (agent.has_pending_work()).
+    The agents are shuffled exactly as with RandomActivation and the sleeping ones are
+    skipped, so a run gives the same results as with RandomActivation as long as an
+    agent without pending work does nothing in its step.
+
+    attr:
+        awake: the ids of the agents to activate at their next turn
+    """
+
+    def __init__(self, model):
+        """Create a new, empty EventDrivenActivation."""
+        super().__init__(model)
+        self.__awake: Set = set()
+
+    def add(self, agent):
+        """Add an agent to the schedule (it starts awake)."""
+        super().add(agent)
+        self.__awake.add(agent.unique_id)
+
+    def remove(self, agent):
+        """Remove an agent from the schedule."""
+        super().remove(agent)
+        self.__awake.discard(agent.unique_id)
+
+    def wake(self, agent_id):
+        """Activate the agent at its next turn (in this step if it has not played yet)."""
+        self.__awake.add(agent_id)
+
+    def get_nbr_awake_agents(self) -> int:
+        """Return the number of agents that will be activated at their next turn."""
+        return len(self.__awake)
+
+    def step(self):
+        """Execute the step of the awake agents, in random order."""
+        for agent in self.agent_buffer(shuffled=True):
+            if agent.unique_id not in self.__awake:
+                continue
+            self.__awake.discard(agent.unique_id)
+            agent.step()
+            if agent.has_pending_work():
+                self.__awake.add(agent.unique_id)
+        self.steps += 1
+        self.time += 1
@@ -1,29 +1,79 @@
 """Run a batch."""
 
 
-import os
+from typing import Optional
 
 from tqdm import tqdm
 
 from argument_model import ArgumentModel
+from communication.datacollection.ChunkedResultSink import ChunkedResultSink
+from communication.datacollection.CollectionCadence import CollectionCadence
 
 
-def run_and_save(nbr_steps: int = 100, results_folder: str = "./results"):
-    """Run and save one epoch."""
+def run_and_save(
+    nbr_steps: int = 100,
+    results_folder: str = "./results",
+    seed: int = None,
+    renegotiate: bool = True,
+    max_discussion_rounds: Optional[int] = None,
+    collection_cadence: CollectionCadence = CollectionCadence.EVERY_K_STEPS,
+    collection_every: int = 1,
+    flush_every: int = 10,
+    file_format: Optional[str] = None,
+):
+    """Run and save one epoch (reproducible if seeded).
+
+    The collected rows are streamed to shards in results_folder every flush_every
+    steps (see ChunkedResultSink). If the folder holds an unfinished run, it is
+    resumed: the run is replayed with its seed up to the last flushed step, then
+    goes on. With CollectionCadence.FINAL_ONLY, only the end of run values are saved.
+    Called with run_and_save(**SETTLING_PARAMS) (see argument_model), the run settles
+    before nbr_steps.
+    """
+    if ChunkedResultSink.has_manifest(results_folder):
+        manifest = ChunkedResultSink.read_manifest(results_folder)
+        if manifest["complete"]:
+            return
+        seed = manifest["metadata"]["seed"]
+        renegotiate = manifest["metadata"].get("renegotiate", renegotiate)
+        max_discussion_rounds = manifest["metadata"].get(
+            "max_discussion_rounds", max_discussion_rounds
+        )
 
     # Generate the model
-    model = ArgumentModel(nb_agents=10, nb_items=10)
+    model = ArgumentModel(
+        nb_agents=10,
+        nb_items=10,
+        seed=seed,
+        renegotiate=renegotiate,
+        max_discussion_rounds=max_discussion_rounds,
+        collection_cadence=collection_cadence,
+        collection_every=collection_every,
+    )
+    sink = ChunkedResultSink(
+        results_folder,
+        flush_every,
+        file_format,
+        metadata={
+            "seed": model.seed,
+            "nbr_steps": nbr_steps,
+            "renegotiate": renegotiate,
+            "max_discussion_rounds": max_discussion_rounds,
+        },
+    )
 
-    # Run the simulation
-    for _ in tqdm(range(nbr_steps)):
+    # Replay the steps already saved (the run only depends on its seed)
+    while model.schedule.steps < (sink.get_last_step() or 0):
         model.step()
+    model.datacollector.clear()
 
-    # Save the results
-    os.makedirs(results_folder, exist_ok=True)
-    agent_vars = model.datacollector.get_agent_vars_dataframe()
-    agent_vars.to_csv(os.path.join(results_folder, "agents.csv"))
-    model_vars = model.datacollector.get_model_vars_dataframe()
-    # model_vars.to_csv(os.path.join(results_folder, "model.csv"))
+    # Run the simulation (until the negotiation settles, at most nbr_steps)
+    for _ in tqdm(range(model.schedule.steps, nbr_steps)):
+        if not model.running:
+            break
+        model.step()
+        sink.step(model)
+    sink.close(model, metadata={"convergence_step": model.convergence_step})
 
 
 if __name__ == "__main__":
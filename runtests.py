@@ -3,14 +3,36 @@
 Testing all the functionalities of the communication package.
 """
 
+import json
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
 from mesa import Model
 from mesa.time import RandomActivation
+from mesa.visualization.modules import BarChartModule, ChartModule, PieChartModule
 
+from argument_model import SETTLING_PARAMS, ArgumentModel
+from checkpoint import get_checkpoint_path, load_checkpoint, save_checkpoint
 from communication.agent.CommunicatingAgent import CommunicatingAgent
+from communication.arguments.Argument import Argument
+from communication.datacollection.ChunkedResultSink import ChunkedResultSink
+from communication.datacollection.CollectionCadence import CollectionCadence
+from communication.datacollection.ColumnarDataCollector import ColumnarDataCollector
+from communication.datacollection.EventCounters import EventCounters
 from communication.mailbox.Mailbox import Mailbox
+from communication.mailbox.RetentionPolicy import RetentionPolicy
 from communication.message.Message import Message
 from communication.message.MessagePerformative import MessagePerformative
 from communication.message.MessageService import MessageService
+from communication.preferences.CriterionName import CriterionName
+from communication.preferences.Item import Item
+from communication.preferences.Value import Value
+from communication.scheduler.EventDrivenActivation import EventDrivenActivation
+from sweep import run_sweep
+from topology import TOPOLOGIES, build_topology
 
 
 class TestAgent(CommunicatingAgent):
@@ -23,19 +45,47 @@ class TestAgent(CommunicatingAgent):
         super().step()
 
 
+class CountingAgent(TestAgent):
+    """TestAgent which reads its messages and counts its steps."""
+
+    def __init__(self, unique_id, model, name):
+        super().__init__(unique_id, model, name)
+        self.nbr_steps = 0
+
+    def step(self):
+        self.nbr_steps += 1
+        self.get_new_messages()
+
+
 class TestModel(Model):
     """TestModel which inherit from Model to test CommunicatingAgent and MessageService."""
 
-    def __init__(self):
-        self.schedule = RandomActivation(self)
-        self.__messages_service = MessageService(self.schedule)
+    def __init__(self, scheduler_class=RandomActivation, agent_class=TestAgent):
+        self.schedule = scheduler_class(self)
+        self.message_service = MessageService(self.schedule)
         for i in range(2):
-            a = TestAgent(i, self, "Agent" + str(i))
+            a = agent_class(i, self, "Agent" + str(i))
             self.schedule.add(a)
         self.running = True
 
     def step(self):
-        self.__messages_service.dispatch_messages()
+        self.message_service.dispatch_messages()
+        self.schedule.step()
+
+
+class RandomArgumentModel(ArgumentModel):
+    """ArgumentModel activating all its agents at each step (RandomActivation)."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        agents = self.schedule.agents
+        self.schedule = RandomActivation(self)
+        for agent in agents:
+            self.schedule.add(agent)
+        self.message_service = MessageService(self.schedule)
+
+    def step(self):
+        self.message_service.dispatch_messages()
         self.schedule.step()
 
 
@@ -66,6 +116,53 @@ if __name__ == "__main__":
     assert len(mailbox.get_messages_from_performative(MessagePerformative.ARGUE)) == 1
     print("*     get_messages_from_performative() => OK")
 
+    m4 = Message("Agent1", "Agent2", MessagePerformative.ARGUE, "Hi")
+    m5 = Message("Agent3", "Agent2", MessagePerformative.ARGUE, "Hallo")
+    mailbox.receive_messages(m4)
+    mailbox.receive_messages(m5)
+    assert mailbox.has_unread_message_with_performative(MessagePerformative.ARGUE)
+    assert not mailbox.has_unread_message_with_performative(MessagePerformative.PROPOSE)
+    assert len(mailbox.get_messages_from_exp("Agent3")) == 1
+    assert (
+        mailbox.get_last_unread_message_with_performative(
+            MessagePerformative.ARGUE, "Agent3"
+        )
+        is m5
+    )
+    assert (
+        mailbox.get_last_unread_message_with_performative(MessagePerformative.ARGUE)
+        is m4
+    )
+    assert not mailbox.has_unread_message_with_performative(MessagePerformative.ARGUE)
+    assert len(mailbox.get_messages_from_performative(MessagePerformative.ARGUE)) == 3
+    print("*     has/get_last_unread_message_with_performative() => OK")
+
+    bounded_mailbox = Mailbox(RetentionPolicy.KEEP_LAST, max_read_messages=2)
+    for message in (m1, m2, m3):
+        bounded_mailbox.receive_messages(message)
+    assert bounded_mailbox.get_messages() == [m2, m3]
+    assert bounded_mailbox.get_messages_from_exp("Agent1") == [m2]
+    print("*     retention policy KEEP_LAST => OK")
+
+    with tempfile.TemporaryDirectory() as folder:
+        spilling_mailbox = Mailbox(
+            RetentionPolicy.SPILL_TO_DISK,
+            max_read_messages=1,
+            spill_path=os.path.join(folder, "mailbox.log"),
+        )
+        for message in (m1, m2, m3):
+            spilling_mailbox.receive_messages(message)
+        assert len(spilling_mailbox.get_messages()) == 1
+        assert len(spilling_mailbox.get_messages(include_spilled=True)) == 3
+        assert len(spilling_mailbox.get_messages_from_exp("Agent1", True)) == 2
+        assert str(spilling_mailbox.get_spilled_messages(1, 2)[0]) == str(m2)
+        restored_mailbox = pickle.loads(pickle.dumps(spilling_mailbox))
+        restored_mailbox.receive_messages(m1)
+        restored_mailbox.get_new_messages()
+        assert len(restored_mailbox.get_messages(include_spilled=True)) == 4
+        assert len(spilling_mailbox.get_messages(include_spilled=True)) == 3
+    print("*     retention policy SPILL_TO_DISK => OK")
+
     print("* 2) Testing CommunicatingAgent & MessageService")
 
     communicating_model = TestModel()
@@ -90,7 +187,7 @@ if __name__ == "__main__":
     assert len(agent1.get_messages()) == 2
     print("*     send_message() & dispatch_message (instant delivery) => OK")
 
-    MessageService.get_instance().set_instant_delivery(False)
+    communicating_model.message_service.set_instant_delivery(False)
 
     agent0.send_message(Message(0, 1, MessagePerformative.COMMIT, "Bonjour"))
     agent1.send_message(Message(1, 0, MessagePerformative.COMMIT, "Bonjour"))
@@ -106,3 +203,430 @@ if __name__ == "__main__":
     assert len(agent0.get_messages()) == 2
     assert len(agent1.get_messages()) == 4
     print("*     send_message() & dispatch_messages => OK")
+
+    agent2 = TestAgent(2, communicating_model, "Agent2")
+    communicating_model.schedule.add(agent2)
+    communicating_model.schedule.remove(agent1)
+    communicating_model.message_service.set_instant_delivery(True)
+    try:
+        agent0.send_message(Message(0, 1, MessagePerformative.COMMIT, "Bonjour"))
+        raise AssertionError("A removed agent should not receive messages")
+    except ValueError:
+        pass
+    assert len(agent1.get_new_messages()) == 0
+    agent0.send_message(Message(0, 2, MessagePerformative.COMMIT, "Bonjour"))
+    assert len(agent2.get_new_messages()) == 1
+    print("*     find_agent_from_name() follows the scheduler => OK")
+
+    communicating_model.message_service.set_instant_delivery(False)
+    agent0.send_message(Message(0, 2, MessagePerformative.PROPOSE, "Un"))
+    agent0.send_message(Message(0, 2, MessagePerformative.PROPOSE, "Deux"))
+    communicating_model.step()
+    assert [m.get_content() for m in agent2.get_new_messages()] == ["Un", "Deux"]
+    assert communicating_model.message_service.get_batch_sizes()[2] == 2
+    print("*     dispatch_messages() delivers batches in order => OK")
+
+    other_model = TestModel()
+    other_agent0 = other_model.schedule.agents[0]
+    other_agent1 = other_model.schedule.agents[1]
+    other_agent0.send_message(Message(0, 1, MessagePerformative.PROPOSE, "Hola"))
+    assert len(other_agent1.get_new_messages()) == 1
+    assert len(agent0.get_new_messages()) == 0
+    assert other_agent0.message_service is not agent0.message_service
+    print("*     one MessageService per model => OK")
+
+    other_agent2 = TestAgent(2, other_model, "Agent2")
+    other_model.schedule.add(other_agent2)
+    receivers = other_agent0.broadcast(MessagePerformative.PROPOSE, "Bonjour à tous")
+    assert receivers == (1, 2)
+    assert other_agent1.get_new_messages()[0] is other_agent2.get_new_messages()[0]
+    other_model.message_service.set_group("pair", [2])
+    assert other_agent1.propose_to_all("Salut", "pair") == (2,)
+    assert len(other_agent1.get_new_messages()) == 0
+    assert len(other_agent2.get_new_messages()) == 1
+    try:
+        other_agent1.propose_to_all("Salut", "paire")
+        raise AssertionError("An unknown group should not be split into ids")
+    except ValueError:
+        pass
+    print("*     broadcast() shares one message between receivers => OK")
+
+    other_service = other_model.message_service
+    other_service.set_instant_delivery(False)
+    other_service.set_link_latency(0, 1, 1)
+    other_service.set_performative_priority(MessagePerformative.COMMIT, -1)
+    other_agent0.send_message(Message(0, 1, MessagePerformative.ARGUE, "Tard"))
+    other_agent0.send_message(Message(0, 2, MessagePerformative.ARGUE, "Argument"))
+    other_agent0.send_message(Message(0, 2, MessagePerformative.COMMIT, "Engagement"))
+    other_model.step()
+    assert len(other_agent1.get_new_messages()) == 0
+    assert [m.get_content() for m in other_agent2.get_new_messages()] == [
+        "Engagement",
+        "Argument",
+    ]
+    assert other_service.get_nbr_pending_messages() == 1
+    other_model.step()
+    assert len(other_agent1.get_new_messages()) == 1
+    print("*     dispatch_messages() with latencies and priorities => OK")
+
+    print("*")
+    print("* 3) Testing ColumnarDataCollector")
+
+    collector = ColumnarDataCollector(
+        agent_metrics=["nbr_sent_messages"],
+        agent_counters={"performative_uses": ["ARGUE", "COMMIT"]},
+        chunk_size=2,
+    )
+    for _ in range(3):
+        collector.collect(other_model)
+        other_agent0.send_message(Message(0, 1, MessagePerformative.ARGUE, "Encore"))
+    assert collector.nbr_steps == 3
+    sent = collector.get_agent_values("nbr_sent_messages")[:, 0]
+    assert list(sent[1:] - sent[:-1]) == [1, 1]
+    agent_vars = collector.get_agent_vars_dataframe()
+    assert len(agent_vars) == 9
+    argue_uses = agent_vars.xs(0, level="AgentID")["performative_uses_ARGUE"]
+    assert argue_uses.iloc[2] - argue_uses.iloc[0] == 2
+    print("*     collect() copies each step in growing arrays => OK")
+
+    chart_model = ArgumentModel(nb_items=6, nb_agents=3, seed=1)
+    for _ in range(3):
+        chart_model.step()
+    fields = [{"Label": f"item_{i}", "Color": "#000000"} for i in range(6)]
+    for chart in [ChartModule(fields), BarChartModule(fields), PieChartModule(fields)]:
+        json.dumps(chart.render(chart_model))
+    done_deals = chart_model.datacollector.get_model_values("done_deals")
+    assert chart_model.datacollector.model_vars["item_1"] == list(done_deals[:, 1])
+    print("*     model_vars can be rendered by mesa's charts => OK")
+
+    events = EventCounters(agent_ids=[0, 1])
+    events.add_agent_counter("nbr_argues")
+    events_collector = ColumnarDataCollector(
+        events=events,
+        agent_events={"nbr_argues": None},
+        cadence=CollectionCadence.ON_CHANGE,
+    )
+    events_collector.collect_step(other_model)
+    other_model.step()
+    events_collector.collect_step(other_model)
+    events.increment_agent("nbr_argues", 1)
+    other_model.step()
+    events_collector.collect_step(other_model)
+    events_collector.collect_final(other_model)
+    collected_steps = events_collector.steps[: events_collector.nbr_steps]
+    assert len(collected_steps) == 2 and collected_steps[1] - collected_steps[0] == 2
+    assert list(events_collector.get_agent_values("nbr_argues")[-1, :2, 0]) == [0, 1]
+    print("*     collect_step() only on change of the event counters => OK")
+
+    other_model.datacollector = events_collector
+    with tempfile.TemporaryDirectory() as results_folder:
+        sink = ChunkedResultSink(results_folder, flush_every=2, file_format="npy")
+        sink.flush(other_model)
+        events.increment_agent("nbr_argues", 0)
+        other_model.step()
+        events_collector.collect_step(other_model)
+        sink.close(other_model)
+        assert ChunkedResultSink.read_manifest(results_folder)["complete"]
+        agent_vars = ChunkedResultSink.read_table(results_folder, "agents")
+        assert len(agent_vars) == 3 * 3 and events_collector.nbr_steps == 0
+        assert agent_vars.xs(0, level="AgentID")["nbr_argues"].iloc[-1] == 1
+    print("*     ChunkedResultSink streams the collected rows to shards => OK")
+
+    print("*")
+    print("* 4) Testing EventDrivenActivation")
+
+    event_model = TestModel(EventDrivenActivation, CountingAgent)
+    event_agent0, event_agent1 = event_model.schedule.agents
+    event_model.step()
+    event_model.step()
+    assert [event_agent0.nbr_steps, event_agent1.nbr_steps] == [1, 1]
+    event_agent0.send_message(Message(0, 1, MessagePerformative.PROPOSE, "Réveil"))
+    assert event_model.schedule.get_nbr_awake_agents() == 1
+    event_model.step()
+    assert [event_agent0.nbr_steps, event_agent1.nbr_steps] == [1, 2]
+    assert event_model.schedule.get_nbr_awake_agents() == 0
+    print("*     step() skips the agents without pending work => OK")
+
+    event_driven_model = ArgumentModel(nb_items=6, nb_agents=6, seed=3)
+    random_model = RandomArgumentModel(nb_items=6, nb_agents=6, seed=3)
+    for _ in range(15):
+        event_driven_model.step()
+        random_model.step()
+    for name in ["done_deals", "nbr_sent_messages", "performative_uses"]:
+        assert np.array_equal(
+            event_driven_model.events.get(name), random_model.events.get(name)
+        )
+    assert event_driven_model.events.get("nbr_sent_messages").sum() > 0
+    print("*     a seeded run matches RandomActivation => OK")
+
+    print("*")
+    print("* 5) Testing ArgumentModel")
+
+    for limits in [
+        {"max_discussion_rounds": 3},
+        {"max_discussion_messages": 8},
+        {"max_discussion_steps": 3, "instant_delivery": False, "latency": 2},
+    ]:
+        limited_model = ArgumentModel(
+            nb_items=6, nb_agents=6, seed=1, renegotiate=False, **limits
+        )
+        while limited_model.running and limited_model.schedule.steps < 100:
+            limited_model.step()
+        assert limited_model.nbr_aborted_discussions > 0
+        assert limited_model.get_nbr_open_discussions() == 0
+        nbr_cancels = limited_model.events.get("performative_uses")[
+            :, list(MessagePerformative).index(MessagePerformative.CANCEL)
+        ].sum()
+        assert nbr_cancels == limited_model.nbr_aborted_discussions
+    print("*     discussions over a limit are aborted on both sides => OK")
+
+    # The proposer cannot argue (it proposes other items) and the responder never
+    # accepts: only the round limit ends the ASK_WHY / PROPOSE cycle
+    cycling_model = ArgumentModel(
+        nb_items=6, nb_agents=2, seed=1, renegotiate=False, max_discussion_rounds=3
+    )
+    proposer, responder = cycling_model.schedule.agents
+    proposer.generate_argument = lambda *args, **kwargs: None
+    responder.preference.most_preferred = lambda items: None
+    while cycling_model.running and cycling_model.schedule.steps < 50:
+        cycling_model.step()
+    assert not cycling_model.running
+    assert cycling_model.nbr_aborted_discussions == 1
+    assert cycling_model.get_nbr_open_discussions() == 0
+    print("*     questions and re-proposals count as rounds => OK")
+
+    # Every agent proposes its favourite item to the others at the first step
+    crossing_model = ArgumentModel(nb_items=6, nb_agents=3, seed=3)
+    crossing_model.step()
+    for agent in crossing_model.schedule.agents:
+        favourite = agent.preference.most_preferred(crossing_model.items)
+        for peer in crossing_model.get_neighbours(agent.unique_id):
+            assert (peer, favourite) in agent.current_discussions
+    assert crossing_model.get_nbr_open_discussions() > 6
+    print("*     crossing proposals open separate discussions => OK")
+
+    for topology in TOPOLOGIES:
+        neighbours = build_topology(topology, 10, seed=1, degree=4)
+        assert sorted(neighbours) == list(range(10))
+        for agent_id, agent_neighbours in neighbours.items():
+            assert agent_id not in agent_neighbours
+            assert all(agent_id in neighbours[peer] for peer in agent_neighbours)
+        reached, frontier = {0}, [0]
+        while frontier:
+            frontier = [
+                peer
+                for agent_id in frontier
+                for peer in neighbours[agent_id]
+                if peer not in reached and not reached.add(peer)
+            ]
+        assert len(reached) == 10
+    assert build_topology("ring", 10)[0] == (1, 9)
+    assert all(len(peers) == 4 for peers in build_topology("regular", 10, 1).values())
+    small_world = build_topology("small_world", 10, 1)
+    assert sum(len(peers) for peers in small_world.values()) == 40
+    scale_free = build_topology("scale_free", 10, 1)
+    assert sum(len(peers) for peers in scale_free.values()) == 2 * (10 - 2) * 2
+    assert all(len(peers) >= 2 for peers in scale_free.values())
+    assert ArgumentModel(nb_agents=6, topology="ring").get_neighbours(0) == (1, 5)
+    for topology, nb_agents in [("regular", 2), ("small_world", 3), ("scale_free", 2)]:
+        try:
+            ArgumentModel(nb_agents=nb_agents, topology=topology)
+            raise AssertionError("The default degree does not fit so few agents")
+        except ValueError:
+            pass
+    print("*     build_topology() gives symmetric connected neighbourhoods => OK")
+
+    seeded_models = [
+        ArgumentModel(nb_items=6, nb_agents=6, seed=seed) for seed in [7, 7, 8]
+    ]
+    for _ in range(15):
+        for seeded_model in seeded_models:
+            seeded_model.step()
+    first_vars, second_vars, other_vars = (
+        seeded_model.datacollector.get_agent_vars_dataframe()
+        for seeded_model in seeded_models
+    )
+    assert first_vars.equals(second_vars) and first_vars["nbr_won"].sum() > 0
+    assert not first_vars.equals(other_vars)
+    print("*     two models with the same seed give the same run => OK")
+
+    with tempfile.TemporaryDirectory() as spill_folder:
+        spilling_models = [
+            ArgumentModel(
+                nb_items=6,
+                nb_agents=6,
+                seed=7,
+                retention_policy=RetentionPolicy.SPILL_TO_DISK,
+                max_read_messages=2,
+                spill_folder=spill_folder,
+            )
+            for _ in range(2)
+        ]
+        for _ in range(5):
+            for spilling_model in spilling_models:
+                spilling_model.step()
+        first_messages, second_messages = (
+            [str(m) for m in spilling_model.schedule.agents[0].get_messages(True)]
+            for spilling_model in spilling_models
+        )
+        assert len(first_messages) > 2 and first_messages == second_messages
+        assert len(os.listdir(spill_folder)) == 2
+    print("*     models sharing a spill folder keep their own logs => OK")
+
+    settling_model = ArgumentModel(nb_items=6, nb_agents=6, seed=1, **SETTLING_PARAMS)
+    while settling_model.running and settling_model.schedule.steps < 100:
+        settling_model.step()
+    assert not settling_model.running and settling_model.schedule.steps < 100
+    assert settling_model.convergence_step == settling_model.schedule.steps
+    assert settling_model.is_quiescent()
+    print("*     a seeded model stops when the negotiation settles => OK")
+
+    final_model = ArgumentModel(
+        nb_items=6,
+        nb_agents=6,
+        seed=1,
+        collection_cadence=CollectionCadence.FINAL_ONLY,
+        **SETTLING_PARAMS,
+    )
+    while final_model.running:
+        final_model.step()
+    assert final_model.datacollector.nbr_steps == 1
+    assert final_model.datacollector.steps[0] == final_model.convergence_step
+    final_deals = final_model.datacollector.get_model_values("done_deals")[0]
+    assert list(final_deals) == list(final_model.done_deals.values())
+    print("*     a stopping model collects its final step => OK")
+
+    argument = Argument(True, item=Item("D", ""))
+    same_argument = Argument(True, item=Item("D", ""))
+    assert argument == same_argument and hash(argument) == hash(same_argument)
+    argument.add_premiss_couple_values(CriterionName.NOISE, Value.GOOD)
+    assert argument != same_argument
+    same_argument.add_premiss_couple_values(CriterionName.NOISE, Value.GOOD)
+    assert argument == same_argument and hash(argument) == hash(same_argument)
+    print("*     Argument equality follows its content => OK")
+
+    cache_model = ArgumentModel(nb_items=6, nb_agents=2, seed=1)
+    cache_agent, other_agent = cache_model.schedule.agents
+    electric = cache_model.items[0]
+    first_argument = cache_agent.generate_argument(electric)
+    assert cache_agent.generate_argument(electric) is first_argument
+    assert cache_agent.argument_cache_hits == 1
+    assert cache_agent.argument_cache_misses == 1
+    cache_agent.set_preferences(other_agent.get_preference())
+    assert cache_agent.generate_argument(electric) == other_agent.generate_argument(
+        electric
+    )
+    assert cache_agent.generate_argument(electric) != first_argument
+    assert cache_agent.argument_cache_hits == 2
+    assert cache_agent.argument_cache_misses == 2
+    print("*     generate_argument() is memoized until the preferences change => OK")
+
+    print("*")
+    print("* 6) Testing the sweep")
+
+    with tempfile.TemporaryDirectory() as sweep_folder:
+        sweep_params = {
+            "nb_agents": (4,),
+            "nb_items": (6,),
+            "topologies": ("complete",),
+            "nbr_steps": 30,
+            "model_params": {
+                "retention_policy": RetentionPolicy.KEEP_ALL,
+                "collection_cadence": CollectionCadence.EVERY_K_STEPS,
+            },
+            "results_folder": sweep_folder,
+            "max_workers": 2,
+        }
+        summary = run_sweep(seeds=range(2), **sweep_params)
+        assert summary["nbr_runs"].iloc[0] == 2
+        runs_folder = os.path.join(sweep_folder, "runs")
+        first_run = os.path.join(runs_folder, sorted(os.listdir(runs_folder))[0])
+        with open(first_run) as result_file:
+            first_result = json.load(result_file)
+        assert first_result["retention_policy"] == "KEEP_ALL"
+        first_result["duration"] = -1
+        with open(first_run, "w") as result_file:
+            json.dump(first_result, result_file)
+        summary = run_sweep(seeds=range(3), **sweep_params)
+        assert summary["nbr_runs"].iloc[0] == 3 and len(os.listdir(runs_folder)) == 3
+        runs = pd.read_csv(os.path.join(sweep_folder, "runs.csv"))
+        assert (runs["duration"] < 0).sum() == 1
+    print("*     run_sweep() resumes without running the saved replications => OK")
+
+    print("*")
+    print("* 7) Testing the checkpoints")
+
+    with tempfile.TemporaryDirectory() as checkpoint_folder:
+        spill_folder = os.path.join(checkpoint_folder, "spill")
+        for model_params in [
+            {"instant_delivery": False},
+            {
+                "retention_policy": RetentionPolicy.SPILL_TO_DISK,
+                "max_read_messages": 5,
+                "spill_folder": spill_folder,
+            },
+        ]:
+            original_model = ArgumentModel(
+                nb_items=6, nb_agents=6, seed=5, **model_params
+            )
+            for _ in range(10):
+                original_model.step()
+            checkpoint_path = save_checkpoint(
+                original_model, os.path.join(checkpoint_folder, "step-10.pkl.gz")
+            )
+            restored_model = load_checkpoint(checkpoint_path)
+            for _ in range(10):
+                original_model.step()
+                restored_model.step()
+            assert restored_model.schedule.steps == 20
+            assert restored_model.datacollector.get_agent_vars_dataframe().equals(
+                original_model.datacollector.get_agent_vars_dataframe()
+            )
+            for original_agent, restored_agent in zip(
+                original_model.schedule.agents, restored_model.schedule.agents
+            ):
+                assert [str(m) for m in restored_agent.get_messages(True)] == [
+                    str(m) for m in original_agent.get_messages(True)
+                ]
+            assert len(restored_model.schedule.agents[0].get_messages(True)) > 5
+            if "spill_folder" in model_params:
+                assert len(os.listdir(original_model.spill_directory)) == 2 * 6
+            restored_model.close()
+            original_model.close()
+        assert len(os.listdir(original_model.spill_directory)) == 6
+    print("*     a restored model continues like the original one => OK")
+
+    with tempfile.TemporaryDirectory() as checkpoint_folder:
+        run_folder = os.path.join(checkpoint_folder, "run")
+        fork_folder = os.path.join(checkpoint_folder, "fork")
+        checkpointed_model = ArgumentModel(
+            nb_items=6,
+            nb_agents=6,
+            seed=5,
+            checkpoint_every=5,
+            checkpoint_folder=run_folder,
+        )
+        for _ in range(10):
+            checkpointed_model.step()
+        checkpoint_paths = [get_checkpoint_path(run_folder, step) for step in [5, 10]]
+        assert sorted(os.listdir(run_folder)) == [
+            os.path.basename(path) for path in checkpoint_paths
+        ]
+        with open(checkpoint_paths[1], "rb") as checkpoint_file:
+            saved_checkpoint = checkpoint_file.read()
+        unsaved_fork = load_checkpoint(checkpoint_paths[0])
+        saved_fork = load_checkpoint(checkpoint_paths[0], fork_folder)
+        for _ in range(5):
+            unsaved_fork.step()
+            saved_fork.step()
+        assert unsaved_fork.checkpoint_every is None
+        with open(checkpoint_paths[1], "rb") as checkpoint_file:
+            assert checkpoint_file.read() == saved_checkpoint
+        assert os.listdir(fork_folder) == [os.path.basename(checkpoint_paths[1])]
+        resumed_model = load_checkpoint(
+            get_checkpoint_path(fork_folder, 10), checkpoint_folder=run_folder
+        )
+        for _ in range(5):
+            resumed_model.step()
+        assert len(os.listdir(run_folder)) == 3
+    print("*     checkpoint_every saves automatic checkpoints, not in forks => OK")
@@ -0,0 +1,189 @@
+"""Run a parameter sweep over several processes."""
+
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from enum import Enum
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from argument_model import ArgumentModel
+from communication.datacollection.CollectionCadence import CollectionCadence
+
+
+def encode_value(value):
+    """Return the JSON value of a parameter that json cannot encode (enums by name)."""
+    if isinstance(value, Enum):
+        return value.name
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def get_result_key(params: Dict) -> str:
+    """Return the (deterministic) file name of the result of a replication."""
+    digest = hashlib.sha1(
+        json.dumps(params, sort_keys=True, default=encode_value).encode()
+    ).hexdigest()
+    return (
+        f"agents{params['nb_agents']}_items{params['nb_items']}_"
+        f"{params['topology']}_seed{params['seed']}_{digest[:8]}"
+    )
+
+
+def run_replication(params: Dict) -> Dict:
+    """Run one model until it settles (at most nbr_steps) and summarize it.
+
+    The model only collects its final step, unless params set collection_cadence.
+    """
+    params = dict(params)
+    nbr_steps = params.pop("nbr_steps")
+    start = time.perf_counter()
+    model = ArgumentModel(
+        **{"collection_cadence": CollectionCadence.FINAL_ONLY, **params}
+    )
+    while model.running and model.schedule.steps < nbr_steps:
+        model.step()
+
+    events = model.events
+    return {
+        **params,
+        "nbr_steps": model.schedule.steps,
+        "convergence_step": model.convergence_step,
+        "nbr_deals": int(events.get("done_deals").sum()),
+        "nbr_sent_messages": int(events.get("nbr_sent_messages").sum()),
+        "nbr_aborted_discussions": int(events.get("nbr_aborted_discussions")),
+        "nbr_open_discussions": model.get_nbr_open_discussions(),
+        "duration": time.perf_counter() - start,
+        **{
+            f"deals_{item.get_name()}": int(nbr_deals)
+            for item, nbr_deals in zip(model.items, events.get("done_deals"))
+        },
+    }
+
+
+def iter_grid(
+    nb_agents: Iterable[int],
+    nb_items: Iterable[int],
+    seeds: Iterable[int],
+    topologies: Iterable[str],
+    nbr_steps: int,
+    model_params: Optional[Dict] = None,
+):
+    """Yield the parameters of each replication of the grid.
+
+    model_params are passed to the models (e.g. SETTLING_PARAMS for runs that settle).
+    """
+    for agents, items, topology, seed in itertools.product(
+        nb_agents, nb_items, topologies, seeds
+    ):
+        yield {
+            **(model_params or {}),
+            "nb_agents": agents,
+            "nb_items": items,
+            "topology": topology,
+            "seed": seed,
+            "nbr_steps": nbr_steps,
+        }
+
+
+def save_result(result_folder: str, key: str, result: Dict) -> None:
+    """Write the result of a replication (atomically)."""
+    path = os.path.join(result_folder, f"{key}.json")
+    with open(path + ".tmp", "w") as result_file:
+        json.dump(result, result_file, default=encode_value)
+    os.replace(path + ".tmp", path)
+
+
+def run_sweep(
+    nb_agents: Iterable[int] = (10,),
+    nb_items: Iterable[int] = (10,),
+    seeds: Iterable[int] = range(10),
+    topologies: Iterable[str] = ("complete",),
+    nbr_steps: int = 100,
+    model_params: Optional[Dict] = None,
+    results_folder: str = "./results/sweep",
+    max_workers: Optional[int] = None,
+    max_pending: Optional[int] = None,
+) -> pd.DataFrame:
+    """Run the replications of the grid that have no result yet, then summarize.
+
+    Each result is saved as runs/<key>.json as soon as it is ready, so an interrupted
+    sweep resumes where it stopped. At most max_pending replications (2 per worker by
+    default) are submitted at once. The runs and their means by configuration are
+    written to runs.csv and summary.csv, and the summary is returned.
+    """
+    runs_folder = os.path.join(results_folder, "runs")
+    os.makedirs(runs_folder, exist_ok=True)
+    grid = [
+        (get_result_key(params), params)
+        for params in iter_grid(
+            nb_agents, nb_items, seeds, topologies, nbr_steps, model_params
+        )
+    ]
+    tasks = (
+        (key, params)
+        for key, params in grid
+        if not os.path.exists(os.path.join(runs_folder, f"{key}.json"))
+    )
+
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * max_workers
+    with ProcessPoolExecutor(max_workers) as executor:
+        pending = {}
+        for key, params in itertools.islice(tasks, max_pending):
+            pending[executor.submit(run_replication, params)] = key
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                save_result(runs_folder, pending.pop(future), future.result())
+            for key, params in itertools.islice(tasks, len(done)):
+                pending[executor.submit(run_replication, params)] = key
+
+    return summarize(results_folder, [key for key, _ in grid])
+
+
+def summarize(results_folder: str, keys: Optional[List[str]] = None) -> pd.DataFrame:
+    """Aggregate the results of a sweep in runs.csv and summary.csv.
+
+    keys selects the replications (all the saved ones by default).
+    """
+    runs_folder = os.path.join(results_folder, "runs")
+    if keys is None:
+        keys = sorted(
+            file_name[: -len(".json")]
+            for file_name in os.listdir(runs_folder)
+            if file_name.endswith(".json")
+        )
+    runs: List[Dict] = []
+    for key in keys:
+        with open(os.path.join(runs_folder, f"{key}.json")) as result_file:
+            runs.append(json.load(result_file))
+    runs_df = pd.DataFrame(runs)
+    runs_df.to_csv(os.path.join(results_folder, "runs.csv"), index=False)
+
+    configuration = ["nb_agents", "nb_items", "topology"]
+    summary = runs_df.groupby(configuration).agg(
+        nbr_runs=("seed", "count"),
+        nbr_converged=("convergence_step", "count"),
+        **{
+            f"{column}_{statistic}": (column, statistic)
+            for column in [
+                "nbr_steps",
+                "nbr_deals",
+                "nbr_sent_messages",
+                "nbr_aborted_discussions",
+                "duration",
+            ]
+            for statistic in ["mean", "std"]
+        },
+    )
+    summary.to_csv(os.path.join(results_folder, "summary.csv"))
+    return summary
+
+
+if __name__ == "__main__":
+
+    print(run_sweep())
@@ -0,0 +1,69 @@
+"""Negotiation topologies: who opens discussions with whom."""
+
+from typing import Dict, Tuple
+
+import networkx as nx
+
+TOPOLOGIES = ("complete", "ring", "regular", "small_world", "scale_free")
+
+
+def get_nbr_links(degree: int) -> int:
+    """Return the number of agents each new agent is linked to (scale_free)."""
+    return max(1, degree // 2)
+
+
+def check_degree(name: str, nb_agents: int, degree: int) -> None:
+    """Raise a ValueError if a topology cannot have this degree with nb_agents agents."""
+    if name == "regular" and (not 0 <= degree < nb_agents or degree * nb_agents % 2):
+        condition = "0 <= degree < nb_agents and degree * nb_agents even"
+    elif name == "small_world" and not 2 <= degree <= nb_agents:
+        condition = "2 <= degree <= nb_agents"
+    elif name == "scale_free" and get_nbr_links(degree) >= nb_agents:
+        condition = "degree // 2 < nb_agents"
+    else:
+        return
+    raise ValueError(
+        f"The {name} topology needs {condition} "
+        f"(degree {degree}, {nb_agents} agents)"
+    )
+
+
+def build_topology(
+    name: str,
+    nb_agents: int,
+    seed: int = None,
+    degree: int = 4,
+    rewiring_probability: float = 0.1,
+) -> Dict[int, Tuple[int, ...]]:
+    """Return the neighbours of each agent id (0 to nb_agents - 1), sorted by id.
+
+    - complete: every agent discusses with every other one
+    - ring: each agent discusses with its two neighbours on a cycle
+    - regular: random graph where each agent has `degree` neighbours
+    - small_world: Watts-Strogatz graph (`degree` neighbours, `rewiring_probability`)
+    - scale_free: Barabasi-Albert graph (each new agent is linked to `degree // 2` agents)
+
+    Raise a ValueError if the degree does not fit the number of agents.
+    """
+    check_degree(name, nb_agents, degree)
+    if name == "complete":
+        agent_ids = tuple(range(nb_agents))
+        return {
+            agent_id: agent_ids[:agent_id] + agent_ids[agent_id + 1 :]
+            for agent_id in agent_ids
+        }
+    if name == "ring":
+        graph = nx.cycle_graph(nb_agents)
+    elif name == "regular":
+        graph = nx.random_regular_graph(degree, nb_agents, seed=seed)
+    elif name == "small_world":
+        graph = nx.connected_watts_strogatz_graph(
+            nb_agents, degree, rewiring_probability, seed=seed
+        )
+    elif name == "scale_free":
+        graph = nx.barabasi_albert_graph(nb_agents, get_nbr_links(degree), seed=seed)
+    else:
+        raise ValueError(f"Unknown topology {name}, expected one of {TOPOLOGIES}")
+    return {
+        agent_id: tuple(sorted(graph.neighbors(agent_id))) for agent_id in graph.nodes
+    }